@@ -51,6 +51,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'tickets.querystats.QueryStatsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -97,6 +98,28 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# Public catalog responses are cached in the `responses` cache, point it at a file or Redis cache to share it
+# between workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': os.environ.get('RESPONSE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('RESPONSE_CACHE_LOCATION', 'railway-responses'),
+        'TIMEOUT': int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 60)),
+    },
+    # Route change log the journey planner timetables of all workers follow, has to be shared between them. The
+    # process-local default only suits a single worker, see `tickets.timetable.check_change_log`
+    'timetable': {
+        'BACKEND': os.environ.get('TIMETABLE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('TIMETABLE_CACHE_LOCATION', 'railway-timetable'),
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -146,9 +169,17 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema' ,
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'tickets.pagination.RailwayCursorPagination',
+    'PAGE_SIZE': int(os.environ.get('PAGE_SIZE', 50)),
 }
 
+# Upper bound for the ``page_size`` query parameter of list endpoints
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 200))
+
+# Rows fetched and serialized at once by streamed (NDJSON) list responses
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 500))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=1000),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -184,6 +215,46 @@ SIMPLE_JWT = {
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 
+# Pending orders keep their seats only for this long after the last ticket was added
+SEAT_HOLD_TTL = timedelta(minutes=15)
+
+# Journey planner: shortest change between trains and how far after the requested time trains are boarded
+MIN_TRANSFER_TIME = timedelta(minutes=10)
+JOURNEY_SEARCH_HORIZON = timedelta(days=1)
+# Memory-mapped timetable shared by the workers of a host, written by `manage.py build_timetable_snapshot` when the
+# web process starts and every hour after that, see the Procfile
+TIMETABLE_SNAPSHOT_PATH = os.environ.get('TIMETABLE_SNAPSHOT_PATH', os.path.join(BASE_DIR, 'timetable.snapshot'))
+# Seconds after which a worker whose `timetable` cache is local to the process maps the snapshot again (loads the
+# whole timetable without one), the only way it sees route changes made by other processes
+TIMETABLE_RELOAD_INTERVAL = int(os.environ.get('TIMETABLE_RELOAD_INTERVAL', 300))
+
+# Payments: gateway class (`tickets.payments.FakeGateway` for local development), and how many seconds `/buy`
+# waits for a payment intent created by the worker pool before answering 202. Unset to create it inline.
+PAYMENT_GATEWAY = os.environ.get('PAYMENT_GATEWAY', 'tickets.payments.StripeGateway')
+PAYMENT_CURRENCY = 'usd'
+PAYMENT_TIMEOUT = float(os.environ['PAYMENT_TIMEOUT']) if os.environ.get('PAYMENT_TIMEOUT') else None
+PAYMENT_WORKERS = int(os.environ.get('PAYMENT_WORKERS', 8))
+
+# Seconds a worker keeps discount types it did not change itself, see `users.discount_types`
+DISCOUNT_TYPE_CACHE_TIMEOUT = int(os.environ.get('DISCOUNT_TYPE_CACHE_TIMEOUT', 300))
+
+# SQL statistics per endpoint, see `tickets.querystats`: share of requests measured, and whether going over a
+# view's `query_action_budgets` raises instead of logging a warning (for tests, measures every request)
+QUERY_STATS_SAMPLE_RATE = float(os.environ.get('QUERY_STATS_SAMPLE_RATE', 0.01))
+QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT') == '1'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'railway.queries': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        'railway.timetable': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 MEDIA_ROOT = os.path.join(BASE_DIR,'media')
 MEDIA_URL = '/media/'
 stripe.api_key = 'sk_test_51MDmlRGCpPbaDbeuipA1AMyldzcMxez9JwkjxEi972zABClWLhQXoDiKTsbSMuKMLJ8WW9smp28rHOuUorilT54500xItrI2mR'
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class TicketsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tickets'
+
+    def ready(self):
+        from tickets import signals  # noqa: F401
+        from tickets.timetable import check_change_log
+
+        check_change_log()
@@ -0,0 +1,137 @@
+"""
+Async variants of the read-heavy endpoints, for serving under an ASGI server.
+
+DRF dispatches synchronously, so these are plain Django async views that authenticate and answer like the
+viewsets do. Queries go through the async ORM and the batch lookups of the list serializers are done before
+serializing, so serializing prefetched objects does no I/O. Helpers without an async counterpart run through
+``sync_to_async``.
+"""
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db.models import Prefetch
+from django.http import HttpResponse
+from rest_framework import serializers, status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from tickets.availability import aroute_availability
+from tickets.inventory import aleg_mask, free_seats
+from tickets.models import ArrivalPoint, Carriage, CarriageType, City, Route
+from tickets.pagination import RailwayCursorPagination
+from tickets.search import asearch_routes
+from tickets.serializers import ArrivalPointSerializer, CarriageLegParamsSerializer, CarriageSeatsSerializer, \
+    CarriageTypeSerializer, CitySerializer, RouteSerializer, SearchRouteParamsSerializer
+
+
+def _json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+def _unauthorized(detail):
+    response = _json_response(detail if isinstance(detail, dict) else {'detail': detail}, status.HTTP_401_UNAUTHORIZED)
+    response['WWW-Authenticate'] = 'Bearer realm="api"'
+    return response
+
+
+async def _authenticate(request):
+    """:return: the user of the bearer token or ``None`` without credentials"""
+    authentication = JWTAuthentication()
+    if (header := authentication.get_header(request)) is None:
+        return None
+    if (raw_token := authentication.get_raw_token(header)) is None:
+        return None
+    return await sync_to_async(authentication.get_user)(authentication.get_validated_token(raw_token))
+
+
+def async_api_view(*methods):
+    """
+    Turn an async view into an authenticated JSON endpoint.
+
+    Like the viewsets it requires a JWT bearer token, is exempt from CSRF checks and answers validation errors
+    with 400.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return _json_response({'detail': f'Method "{request.method}" not allowed.'},
+                                      status.HTTP_405_METHOD_NOT_ALLOWED)
+            try:
+                user = await _authenticate(request)
+            except (InvalidToken, AuthenticationFailed) as error:
+                return _unauthorized(error.detail)
+            if user is None:
+                return _unauthorized('Authentication credentials were not provided.')
+
+            request.user = user
+            try:
+                return await view(request, *args, **kwargs)
+            except serializers.ValidationError as error:
+                return _json_response(error.detail, status.HTTP_400_BAD_REQUEST)
+
+        # csrf_exempt wraps views in a sync function in this Django version
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+@async_api_view('POST')
+async def search_routes(request):
+    try:
+        params = SearchRouteParamsSerializer(data=json.loads(request.body or b'{}'))
+    except ValueError as error:
+        return _json_response({'detail': f'JSON parse error - {error}'}, status.HTTP_400_BAD_REQUEST)
+    params.is_valid(raise_exception=True)
+
+    departure_point, arrival_point = params.validated_data['departure_city'], params.validated_data.get('arrival_city')
+    existing = {str(point) async for point in ArrivalPoint.objects.filter(
+        id__in=[point for point in (departure_point, arrival_point) if point]).values_list('id', flat=True)}
+    for field, point in (('departure_city', departure_point), ('arrival_city', arrival_point)):
+        if point and point not in existing:
+            raise serializers.ValidationError({field: ['Arrival point does not exist']})
+
+    departure_day = params.validated_data.get('departure_day')
+    routes = await asearch_routes(departure_point, arrival_point, departure_day.date() if departure_day else None)
+    return _json_response(await sync_to_async(_paginate)(request, routes.with_stops(), RouteSerializer))
+
+
+@async_api_view('GET')
+async def route_carriages(request, pk):
+    context = {}
+    params = CarriageLegParamsSerializer(data=request.GET)
+    params.is_valid(raise_exception=True)
+    if params.validated_data:
+        if (mask := await aleg_mask(pk, params.validated_data['departure_point'], params.validated_data['arrival_point'])) is None:
+            return _json_response('No such leg in the route', status.HTTP_400_BAD_REQUEST)
+        context['segment_mask'] = mask
+
+    carriages = Carriage.objects.filter(route_id=pk).prefetch_related(Prefetch('route', queryset=Route.objects.with_stops()))
+    carriages = [carriage async for carriage in carriages]
+    context['free_seats'] = await sync_to_async(free_seats)([carriage.id for carriage in carriages],
+                                                            context.get('segment_mask', -1))
+    context['route_availability'] = await aroute_availability({pk})
+    return _json_response({'data': CarriageSeatsSerializer(carriages, many=True, context=context).data})
+
+
+def _paginate(request, queryset, serializer_class):
+    # DRF pagination evaluates the page itself, so it runs in a thread
+    paginator = RailwayCursorPagination()
+    page = paginator.paginate_queryset(queryset, Request(request))
+    return paginator.get_paginated_response(serializer_class(page, many=True).data).data
+
+
+def _catalog_list(queryset, serializer_class):
+    @async_api_view('GET')
+    async def view(request):
+        return _json_response(await sync_to_async(_paginate)(request, queryset, serializer_class))
+    return view
+
+
+cities = _catalog_list(City.objects.all(), CitySerializer)
+arrival_points = _catalog_list(ArrivalPoint.objects.select_related('arrival_city'), ArrivalPointSerializer)
+carriage_types = _catalog_list(CarriageType.objects.all(), CarriageTypeSerializer)
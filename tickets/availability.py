@@ -0,0 +1,58 @@
+from django.db.models import OuterRef, Subquery
+
+from tickets.models import Carriage, CarriageSeat, Order, Ticket
+
+
+def route_availability(route_ids):
+    """
+    Sum the available seats of many routes from the ``taken_seats`` counters of their carriages.
+
+    Seats taken only by expired seat holds are free even before the holds are released, they are found in a second
+    query over the pending orders only. A carriage never has less than no seats available.
+
+    :param route_ids: ids of the routes to compute availability for
+    :return: ``{route_id: {carriage_type_id: available_seats}}`` for every requested route
+    """
+    return _sum_availability(route_ids, _carriage_seats(route_ids), _expired_holds(route_ids))
+
+
+async def aroute_availability(route_ids):
+    """Async ``route_availability``."""
+    return _sum_availability(route_ids, [carriage async for carriage in _carriage_seats(route_ids)],
+                             [hold async for hold in _expired_holds(route_ids)])
+
+
+def _carriage_seats(route_ids):
+    return Carriage.objects.filter(route__in=route_ids).values('id', 'route_id', 'carriage_type_id', 'seat_amount', 'taken_seats')
+
+
+def _expired_holds(route_ids):
+    # Starts from the few expired orders, a join from the carriages walks every ticket of the routes
+    expired_orders = Order.objects.expired().values('id')
+    seat = CarriageSeat.objects.filter(carriage=OuterRef('carriage'), seat_number=OuterRef('seat_number'))
+    return Ticket.objects.filter(order__in=expired_orders, carriage__route__in=route_ids).annotate(
+        occupied_segments=Subquery(seat.values('occupied_segments')),
+    ).values_list('carriage_id', 'seat_number', 'segment_mask', 'occupied_segments')
+
+
+def _freed_seats(expired_holds):
+    """:return: ``{carriage_id: seats}`` of the seats that only expired holds take"""
+    held, occupied = {}, {}
+    for carriage_id, seat_number, mask, segments in expired_holds:
+        held[(carriage_id, seat_number)] = held.get((carriage_id, seat_number), 0) | mask
+        occupied[(carriage_id, seat_number)] = segments
+    freed = {}
+    for (carriage_id, seat_number), mask in held.items():
+        if occupied[(carriage_id, seat_number)] and not occupied[(carriage_id, seat_number)] & ~mask:
+            freed[carriage_id] = freed.get(carriage_id, 0) + 1
+    return freed
+
+
+def _sum_availability(route_ids, carriages, expired_holds):
+    availability = {route_id: {} for route_id in route_ids}
+    freed = _freed_seats(expired_holds)
+    for carriage in carriages:
+        route_seats = availability[carriage['route_id']]
+        available_seats = max(carriage['seat_amount'] - carriage['taken_seats'] + freed.get(carriage['id'], 0), 0)
+        route_seats[carriage['carriage_type_id']] = route_seats.get(carriage['carriage_type_id'], 0) + available_seats
+    return availability
@@ -0,0 +1,116 @@
+"""
+Departures and arrivals boards: one ``BoardEntry`` per stop of every route, read by point and time.
+
+Entries are rebuilt with the route legs whenever the stops of a route change. Their available seats, the free seats
+of the whole route like the route list shows, are refreshed after the transactions that book or free seats or change
+carriages. Seats of expired holds count as taken until the holds are released.
+"""
+import threading
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from tickets.models import BoardEntry, Carriage
+
+BOARD_POINTS = ('next_point', 'origin', 'destination')
+
+_pending = threading.local()
+
+
+def build_board_entries(route, stops):
+    """
+    Build the board entries of a route, one per stop and the departure city.
+
+    :param route: route instance
+    :param stops: route stops ordered by ``order``
+    :return: list of unsaved ``BoardEntry`` instances, empty for a route without stops
+    """
+    if not stops:
+        return []
+
+    calls = [(0, route.departure_city_id, None, route.departure_time)]
+    calls += [(stop.order, stop.arrival_point_id, stop.arrival_time, stop.arrival_time) for stop in stops]
+    destination = calls[-1][1]
+    entries = []
+    for (order, point, arrival_time, departure_time), next_call in zip(calls, calls[1:] + [None]):
+        entries.append(BoardEntry(
+            route=route,
+            point_id=point,
+            stop_order=order,
+            arrival_time=arrival_time,
+            departure_time=departure_time if next_call else None,
+            next_point_id=next_call[1] if next_call else None,
+            origin_id=route.departure_city_id,
+            destination_id=destination,
+        ))
+    return entries
+
+
+def _available_seats():
+    seats = Carriage.objects.filter(route=OuterRef('route')).order_by().values('route').annotate(
+        seats=Sum(Greatest(F('seat_amount') - F('taken_seats'), 0)),
+    )
+    return Coalesce(Subquery(seats.values('seats')), 0)
+
+
+def replace_board_entries(route_ids, entries):
+    """Replace the board entries of the given routes with ``entries`` and count their available seats."""
+    with transaction.atomic():
+        BoardEntry.objects.filter(route__in=route_ids).delete()
+        BoardEntry.objects.bulk_create(entries, batch_size=1000)
+        refresh_board_seats(route_ids)
+
+
+def refresh_board_seats(route_ids=(), carriage_ids=()):
+    """
+    Recount the available seats of routes on the boards with a single ``UPDATE``.
+
+    :param route_ids: ids of the routes
+    :param carriage_ids: ids of carriages whose routes are refreshed as well
+    """
+    routes = Q(route__in=route_ids) | Q(route__in=Carriage.objects.filter(id__in=carriage_ids).values('route'))
+    BoardEntry.objects.filter(routes).update(available_seats=_available_seats())
+
+
+def _flush_pending_refreshes():
+    route_ids, carriage_ids = getattr(_pending, 'route_ids', set()), getattr(_pending, 'carriage_ids', set())
+    _pending.route_ids, _pending.carriage_ids = set(), set()
+    if route_ids or carriage_ids:
+        refresh_board_seats(route_ids, carriage_ids)
+
+
+def schedule_board_refresh(route_ids=(), carriage_ids=()):
+    """
+    Refresh the available seats of routes on the boards once the current transaction commits.
+
+    The refresh runs after the commit so it holds no locks of the booking, and all the routes changed in one
+    transaction are refreshed together.
+
+    :param route_ids: ids of the routes
+    :param carriage_ids: ids of carriages whose routes are refreshed as well
+    """
+    if not hasattr(_pending, 'route_ids'):
+        _pending.route_ids, _pending.carriage_ids = set(), set()
+    _pending.route_ids.update(route_ids)
+    _pending.carriage_ids.update(carriage_ids)
+    transaction.on_commit(_flush_pending_refreshes)
+
+
+def point_board(point_id, arrivals=False, after=None):
+    """
+    Upcoming departures or arrivals at a point, in time order.
+
+    :param point_id: id of the arrival point
+    :param arrivals: arrivals instead of departures
+    :param after: earliest time to show, now by default
+    :return: queryset of the entry values with the ``BOARD_POINTS`` joined in, boards are read far more often than
+        they change and building model instances for every joined point takes longer than the query
+    """
+    time_field = 'arrival_time' if arrivals else 'departure_time'
+    entries = BoardEntry.objects.filter(point=point_id, **{f'{time_field}__gte': after or timezone.now()})
+    point_fields = [f'{point}{field}' for point in BOARD_POINTS for field in ('_id', '__arrival_city__city_name', '__arrival_place')]
+    return entries.order_by(time_field, 'route_id').values(
+        'route_id', 'stop_order', 'arrival_time', 'departure_time', 'available_seats', *point_fields,
+    )
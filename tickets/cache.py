@@ -0,0 +1,82 @@
+import hashlib
+import threading
+import uuid
+from functools import wraps
+
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+RESPONSE_CACHE_ALIAS = 'responses'
+
+_pending = threading.local()
+
+
+def _version_key(model):
+    return f'version:{model._meta.label_lower}'
+
+
+def _flush_pending_versions():
+    models = getattr(_pending, 'models', set())
+    _pending.models = set()
+    if models:
+        caches[RESPONSE_CACHE_ALIAS].set_many({_version_key(model): uuid.uuid4().hex for model in models}, timeout=None)
+
+
+def invalidate_responses(*models):
+    """
+    Drop cached responses that depend on any of the given models once the current transaction commits.
+
+    Every model has a version token that is part of the keys of the responses built from it, so replacing the
+    token orphans them without having to know their keys.
+    """
+    if not hasattr(_pending, 'models'):
+        _pending.models = set()
+    _pending.models.update(models)
+    transaction.on_commit(_flush_pending_versions)
+
+
+def _cache_key(request, models):
+    cache = caches[RESPONSE_CACHE_ALIAS]
+    version_keys = [_version_key(model) for model in models]
+    versions = cache.get_many(version_keys)
+    if missing := [key for key in version_keys if key not in versions]:
+        for key in missing:
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+        versions.update(cache.get_many(missing))
+
+    query = sorted(request.query_params.lists())
+    fingerprint = hashlib.md5(repr((request.path, query, [versions.get(key) for key in version_keys])).encode()).hexdigest()
+    return f'response:{fingerprint}'
+
+
+def cached_response(*models):
+    """
+    Cache successful responses of a read-only view method per path and query parameters.
+
+    Cached entries are invalidated through ``invalidate_responses`` for any of ``models`` and expire after the
+    ``responses`` cache timeout. Responses carry an ``ETag``, and a matching ``If-None-Match`` gets a 304.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            cache = caches[RESPONSE_CACHE_ALIAS]
+            key = _cache_key(request, models)
+            if (cached := cache.get(key)) is None:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                etag = '"%s"' % hashlib.md5(JSONRenderer().render(response.data)).hexdigest()
+                cache.set(key, (etag, response.data))
+            else:
+                etag, data = cached
+                response = Response(data, status=status.HTTP_200_OK)
+
+            if etag in (tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+        return wrapper
+    return decorator
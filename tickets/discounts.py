@@ -0,0 +1,43 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from rest_framework import serializers
+
+from tickets.models import Order
+from users.models import Discount
+
+
+@transaction.atomic
+def redeem_discount(order, discount_id, user):
+    """
+    Use a discount of ``user`` once and take it off the price of a pending order.
+
+    The usage counter is only incremented while it is below the limit, by the ``UPDATE`` itself, so concurrent
+    redemptions cannot overshoot it. The order price changes in the same transaction, a limited discount that
+    reaches its limit is deleted.
+
+    :param order: order the discount is applied to
+    :param discount_id: id of the discount
+    :param user: user redeeming the discount
+    :raise serializers.ValidationError: the discount is not the user's, is used up or the order is not pending
+    """
+    if (discount := Discount.objects.select_related('discount_type').filter(id=discount_id).first()) is None:
+        raise serializers.ValidationError({'discount_id': 'No such discount'})
+    if discount.user_id != user.id:
+        raise serializers.ValidationError({'discount_id': 'User does not have this discount'})
+
+    discount_type = discount.discount_type
+    limited = discount_type.discount_type_name == 'limited'
+    discounts = Discount.objects.filter(pk=discount.pk)
+    if limited:
+        discounts = discounts.filter(usage_amount__lt=discount_type.discount_limit)
+    if not discounts.update(usage_amount=F('usage_amount') + 1):
+        raise serializers.ValidationError({'discount_id': 'The number of uses of the discount exceeded the allowable amount'})
+
+    remaining_share = (100 - Decimal(str(discount_type.discount_percent))) / 100
+    if not Order.objects.filter(pk=order.pk, order_status='pending').update(total_price=F('total_price') * remaining_share):
+        raise serializers.ValidationError({'order_status': 'A discount can only be applied to a pending order'})
+
+    if limited:
+        Discount.objects.filter(pk=discount.pk, usage_amount__gte=discount_type.discount_limit).delete()
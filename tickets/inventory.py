@@ -0,0 +1,232 @@
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, Count, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import Exact
+
+from tickets.boards import schedule_board_refresh
+from tickets.models import Carriage, CarriageSeat, RouteLeg, Ticket
+
+# Segment ``i`` is the ride from stop ``i`` to stop ``i + 1`` (the departure city is stop 0) and is stored as bit ``i``
+# of a signed 64 bit column, so a route can have at most 63 segments.
+MAX_ROUTE_SEGMENTS = 63
+
+
+def segment_mask(departure_order, arrival_order):
+    """Bit mask of the segments travelled between two stop orders."""
+    return ((1 << (arrival_order - departure_order)) - 1) << departure_order
+
+
+def leg_mask(route_id, departure_point, arrival_point):
+    """
+    Bit mask of the segments between two points of a route.
+
+    :return: the mask or ``None`` if the route has no such leg
+    """
+    leg = _route_legs(route_id, departure_point, arrival_point).first()
+    return segment_mask(leg.departure_order, leg.arrival_order) if leg else None
+
+
+async def aleg_mask(route_id, departure_point, arrival_point):
+    """Async ``leg_mask``."""
+    leg = await _route_legs(route_id, departure_point, arrival_point).afirst()
+    return segment_mask(leg.departure_order, leg.arrival_order) if leg else None
+
+
+def _route_legs(route_id, departure_point, arrival_point):
+    return RouteLeg.objects.filter(route=route_id, departure_point=departure_point, arrival_point=arrival_point)
+
+
+@transaction.atomic
+def sync_carriage_seats(carriage):
+    """Make the seat inventory of a carriage match its ``seat_amount``, removed taken seats leave its counter."""
+    CarriageSeat.objects.bulk_create(
+        (CarriageSeat(carriage=carriage, seat_number=number) for number in range(1, carriage.seat_amount + 1)),
+        ignore_conflicts=True,
+    )
+    removed = CarriageSeat.objects.filter(carriage=carriage, seat_number__gt=carriage.seat_amount)
+    if occupied := len(removed.exclude(occupied_segments=0).select_for_update().values_list('seat_number')):
+        Carriage.objects.filter(pk=carriage.pk).update(taken_seats=F('taken_seats') - occupied)
+    removed.delete()
+
+
+def create_carriage_seats(carriages):
+    """Create the seat inventory of new carriages, ``sync_carriage_seats`` in bulk."""
+    CarriageSeat.objects.bulk_create(
+        (CarriageSeat(carriage=carriage, seat_number=number)
+         for carriage in carriages for number in range(1, carriage.seat_amount + 1)),
+        batch_size=5000,
+    )
+
+
+def _free(mask):
+    return Exact(F('occupied_segments').bitand(mask), 0)
+
+
+def seats_filter(seats):
+    """``Q`` matching the given ``(carriage_id, seat_number)`` pairs."""
+    return reduce(or_, (Q(carriage=carriage, seat_number=number) for carriage, number in seats))
+
+
+def expired_hold_masks(seat_filter):
+    """
+    Segments still marked in the bitmaps but held by expired pending orders.
+
+    Those segments are free for readers even before the holds are released.
+
+    :param seat_filter: ``Q`` limiting the tickets to look at
+    :return: ``{(carriage_id, seat_number): mask}``
+    """
+    masks = {}
+    expired_tickets = Ticket.objects.expired_holds().filter(seat_filter)
+    for carriage_id, seat_number, mask in expired_tickets.values_list('carriage_id', 'seat_number', 'segment_mask'):
+        masks[(carriage_id, seat_number)] = masks.get((carriage_id, seat_number), 0) | mask
+    return masks
+
+
+def _freed_by_expired_holds(expired, mask):
+    """Seats of ``expired`` that are free on ``mask`` once their expired holds are ignored."""
+    if not expired:
+        return set()
+    occupied = CarriageSeat.objects.filter(seats_filter(expired)).values_list('carriage_id', 'seat_number', 'occupied_segments')
+    return {(carriage, number) for carriage, number, segments in occupied if not segments & ~expired[(carriage, number)] & mask}
+
+
+def free_seats(carriage_ids, mask=-1):
+    """
+    Seat numbers that are free on every segment of ``mask``.
+
+    The default mask covers the whole route, i.e. only seats without any live ticket are returned.
+
+    :return: ``{carriage_id: [seat_number, ...]}`` for every requested carriage
+    """
+    all_seats = CarriageSeat.objects.filter(carriage__in=carriage_ids)
+    free = set(all_seats.filter(_free(mask)).values_list('carriage_id', 'seat_number'))
+    expired = expired_hold_masks(Q(carriage__in=carriage_ids))
+    free |= _freed_by_expired_holds({seat: held for seat, held in expired.items() if seat not in free}, mask)
+
+    seats = {carriage_id: [] for carriage_id in carriage_ids}
+    for carriage_id, seat_number in sorted(free):
+        seats[carriage_id].append(seat_number)
+    return seats
+
+
+def taken_seats(seats, mask):
+    """
+    Seats of ``seats`` that are not free on every segment of ``mask``.
+
+    :param seats: ``(carriage_id, seat_number)`` pairs
+    :return: set of the taken pairs
+    """
+    free = CarriageSeat.objects.filter(_free(mask), seats_filter(seats))
+    if not (taken := set(seats) - set(free.values_list('carriage_id', 'seat_number'))):
+        return taken
+    return taken - _freed_by_expired_holds(expired_hold_masks(seats_filter(taken)), mask)
+
+
+def claim_seats(seats, mask):
+    """
+    Atomically mark the segments of ``mask`` as taken on all the given seats.
+
+    The check and the update are a single conditional ``UPDATE``, so concurrent claims of overlapping legs cannot
+    both succeed and no lock is held beyond the statement's own row locks. When some seats are taken the others are
+    still updated, so callers have to roll back the surrounding transaction.
+
+    :param seats: ``(carriage_id, seat_number)`` pairs
+    :return: whether every seat was free and is now claimed
+    """
+    seats = set(seats)
+    claimed = CarriageSeat.objects.filter(_free(mask), seats_filter(seats)).update(
+        occupied_segments=F('occupied_segments').bitor(mask)
+    )
+    return claimed == len(seats)
+
+
+def _seat_masks(tickets):
+    """:return: ``{(carriage_id, seat_number): mask}`` of the segments the tickets hold on each seat"""
+    masks = {}
+    for carriage_id, seat_number, mask in ((ticket.carriage_id, ticket.seat_number, ticket.segment_mask) for ticket in tickets):
+        masks[(carriage_id, seat_number)] = masks.get((carriage_id, seat_number), 0) | mask
+    return {seat: mask for seat, mask in masks.items() if mask}
+
+
+def release_seats(tickets):
+    """Free the segments held by the given tickets with a single ``UPDATE``."""
+    if not (masks := _seat_masks(tickets)):
+        return
+
+    kept_segments = Case(
+        *(When(Q(carriage=carriage, seat_number=number), then=Value(~mask)) for (carriage, number), mask in masks.items()),
+        output_field=BigIntegerField(),
+    )
+    CarriageSeat.objects.filter(seats_filter(masks)).update(occupied_segments=F('occupied_segments').bitand(kept_segments))
+
+
+def count_taken_seats(tickets, sign=1):
+    """
+    Update the ``taken_seats`` counters of the carriages whose seats the tickets just claimed or released.
+
+    A seat is taken while any of its segments is, so one seat sold on disjoint legs counts once. Called in the
+    transaction of the claim or release, whose ``UPDATE`` still locks the seat rows: a claimed seat was empty before
+    when its bitmap holds only the claimed segments now, a released seat is empty when its bitmap is 0. The counter
+    rows are locked until the transaction ends, so callers update them after their other writes. The boards of the
+    routes are refreshed after the commit.
+
+    :param sign: ``-1`` for released seats
+    """
+    if not (masks := _seat_masks(tickets)):
+        return
+
+    seats = CarriageSeat.objects.filter(seats_filter(masks)).values_list('carriage_id', 'seat_number', 'occupied_segments')
+    counts = Counter(carriage for carriage, number, segments in seats
+                     if segments == (masks[(carriage, number)] if sign > 0 else 0))
+    if not counts:
+        return
+
+    added_seats = Case(
+        *(When(pk=carriage, then=Value(sign * count)) for carriage, count in counts.items()),
+        output_field=IntegerField(),
+    )
+    Carriage.objects.filter(pk__in=counts).update(taken_seats=F('taken_seats') + added_seats)
+    schedule_board_refresh(carriage_ids=counts)
+
+
+def seat_counter_drift(carriages):
+    """
+    Carriages whose ``taken_seats`` counter does not match their seats with any segment taken.
+
+    :param carriages: queryset of the carriages to check
+    :return: ``{carriage_id: (taken_seats, occupied_seats)}``
+    """
+    drifted = carriages.annotate(occupied_seats=_occupied_seats()).exclude(taken_seats=F('occupied_seats'))
+    return {carriage_id: (taken, occupied)
+            for carriage_id, taken, occupied in drifted.values_list('id', 'taken_seats', 'occupied_seats')}
+
+
+@transaction.atomic
+def reconcile_seat_counters(carriages):
+    """
+    Set the ``taken_seats`` counters that drifted to the number of seats of the carriage with any segment taken.
+
+    The carriages are locked before the seats are counted, so bookings that commit meanwhile are either counted or
+    add themselves to the repaired counter afterwards.
+
+    :param carriages: queryset of the carriages to check
+    :return: the repaired drift, like ``seat_counter_drift``
+    """
+    carriage_ids = list(carriages.select_for_update().values_list('id', flat=True))
+    drift = seat_counter_drift(Carriage.objects.filter(id__in=carriage_ids))
+    if drift:
+        Carriage.objects.filter(id__in=drift).update(taken_seats=_occupied_seats())
+        schedule_board_refresh(carriage_ids=drift)
+    return drift
+
+
+def _occupied_seats():
+    seats = CarriageSeat.objects.filter(carriage=OuterRef('pk')).exclude(occupied_segments=0).order_by().values(
+        'carriage',
+    ).annotate(count=Count('seat_number'))
+    return Coalesce(Subquery(seats.values('count')), 0)
@@ -0,0 +1,105 @@
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+
+MAX_JOURNEY_TRANSFERS = 2
+
+# ``legs`` is a tuple of (route id, boarding stop index, alighting stop index)
+Label = namedtuple('Label', ('arrival', 'price', 'legs'))
+
+
+def _dominated(label, bag):
+    return any(other.arrival <= label.arrival and other.price <= label.price for other in bag)
+
+
+def _insert(bags, point, label):
+    """Add ``label`` to the Pareto bag of ``point`` unless a label there is at least as good, drop those it beats."""
+    bag = bags.setdefault(point, [])
+    if _dominated(label, bag):
+        return False
+    bag[:] = [other for other in bag if not (label.arrival <= other.arrival and label.price <= other.price)]
+    bag.append(label)
+    return True
+
+
+def _leg_representation(timetable, route_id, boarding, alighting):
+    stops = timetable.trip(route_id)
+    (departure_point, departure_time, departure_price), (arrival_point, arrival_time, arrival_price) = stops[boarding], stops[alighting]
+    return {
+        'route': route_id,
+        'departure_point': departure_point,
+        'arrival_point': arrival_point,
+        'departure_time': _datetime(departure_time),
+        'arrival_time': _datetime(arrival_time),
+        'price': _price(arrival_price - departure_price),
+    }
+
+
+def _datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+
+def _price(cents):
+    return Decimal(cents) / 100
+
+
+def plan_journeys(timetable, departure_point, arrival_point, departure_time, max_transfers=MAX_JOURNEY_TRANSFERS):
+    """
+    Find the Pareto optimal journeys on arrival time and price, with up to ``max_transfers`` changes of train.
+
+    Works in rounds like RAPTOR: round ``k`` boards, at every point reached in round ``k - 1``, each train leaving
+    after the minimum transfer time and extends the journey to all its later stops. Only labels that are not beaten
+    on both arrival time and price by a label of the same point, or of the destination, are kept.
+
+    :param timetable: timetable from ``tickets.timetable.get_timetable``
+    :param departure_point: id of the point the passenger starts from
+    :param arrival_point: id of the destination point
+    :param departure_time: aware datetime the passenger is ready to leave at
+    :param max_transfers: maximum number of changes of train
+    :return: journeys ordered by arrival time, hence from the earliest arriving to the cheapest
+    """
+    start = int(departure_time.timestamp())
+    latest = start + int(settings.JOURNEY_SEARCH_HORIZON.total_seconds())
+    min_transfer = int(settings.MIN_TRANSFER_TIME.total_seconds())
+
+    bags = {departure_point: [Label(start, 0, ())]}
+    marked = {departure_point: bags[departure_point][:]}
+    for _ in range(max_transfers + 1):
+        reached = {}
+        for point, labels in marked.items():
+            for label in labels:
+                ready = label.arrival + min_transfer if label.legs else label.arrival
+                used_routes = {route_id for route_id, _, _ in label.legs}
+                for _, route_id, boarding in timetable.departures_from(point, ready, latest):
+                    if route_id in used_routes:
+                        continue
+                    stops = timetable.trip(route_id)
+                    boarding_price = stops[boarding][2]
+                    for alighting in range(boarding + 1, len(stops)):
+                        stop_point, arrival, stop_price = stops[alighting]
+                        candidate = Label(arrival, label.price + stop_price - boarding_price,
+                                          label.legs + ((route_id, boarding, alighting), ))
+                        # Not worth extending when a known journey already arrives earlier for less
+                        if _dominated(candidate, bags.get(arrival_point, ())):
+                            continue
+                        if _insert(bags, stop_point, candidate) and stop_point != arrival_point:
+                            reached.setdefault(stop_point, []).append(candidate)
+        if not reached:
+            break
+        marked = reached
+
+    journeys = []
+    for label in sorted(bags.get(arrival_point, []), key=lambda label: (label.arrival, label.price)):
+        if not label.legs:
+            continue
+        legs = [_leg_representation(timetable, *leg) for leg in label.legs]
+        journeys.append({
+            'departure_time': legs[0]['departure_time'],
+            'arrival_time': legs[-1]['arrival_time'],
+            'price': _price(label.price),
+            'transfers': len(legs) - 1,
+            'legs': legs,
+        })
+    return journeys
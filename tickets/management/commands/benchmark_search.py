@@ -0,0 +1,99 @@
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from tickets.models import City, ArrivalPoint, Route, RouteToArrivalPoint
+from tickets.route_index import rebuild_route_legs
+from tickets.search import search_routes
+
+
+class Rollback(Exception):
+    pass
+
+
+def legacy_search_routes(departure_city, arrival_city=None, departure_day=None):
+    """Route lookup as it was done in ``SearchRouteSerializer`` before the set-based search engine."""
+    filtered_routes = Route.objects.filter(departure_city=departure_city)
+    for arrival_point in RouteToArrivalPoint.objects.filter(arrival_point=departure_city):
+        if arrival_point.order != RouteToArrivalPoint.objects.filter(route=arrival_point.route).count():
+            filtered_routes |= Route.objects.filter(id=arrival_point.route.id)
+
+    if departure_day:
+        filtered_routes = filtered_routes.filter(Q(routetoarrivalpoint__arrival_time__date=departure_day) | Q(departure_time__date=departure_day))
+
+    if arrival_city:
+        routes_ids = RouteToArrivalPoint.objects.filter(arrival_point=arrival_city).values_list('route', flat=True)
+        filtered_routes = filtered_routes.filter(id__in=routes_ids)
+    return set(filtered_routes.exclude(departure_time__date__lt=datetime.now().date()))
+
+
+class Command(BaseCommand):
+    help = 'Compare query count and latency of the route search against the legacy per-row implementation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--routes', type=int, default=10000)
+        parser.add_argument('--points', type=int, default=200)
+        parser.add_argument('--stops', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                hub, destination = self.seed(options)
+                self.run(hub, destination, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, options):
+        rnd = random.Random(options['seed'])
+        self.stdout.write(f"Seeding {options['routes']} routes with {options['stops']} stops...")
+        cities = City.objects.bulk_create(City(city_name=f'bench-{i}') for i in range(options['points']))
+        points = ArrivalPoint.objects.bulk_create(ArrivalPoint(arrival_city=city, arrival_place='Central') for city in cities)
+        start = timezone.now() + timedelta(days=1)
+        routes = Route.objects.bulk_create(
+            Route(departure_city=rnd.choice(points), departure_time=start + timedelta(minutes=rnd.randrange(60 * 24 * 30)))
+            for _ in range(options['routes'])
+        )
+        stops = []
+        for route in routes:
+            for order, point in enumerate(rnd.sample(points, options['stops']), start=1):
+                stops.append(RouteToArrivalPoint(route=route, arrival_point=point, order=order, price=Decimal(order * 10),
+                                                 arrival_time=route.departure_time + timedelta(hours=order)))
+        RouteToArrivalPoint.objects.bulk_create(stops, batch_size=5000)
+        rebuild_route_legs([route.id for route in routes])
+        return points[0], points[1]
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                found = {route.id for route in func()}
+                timings.append(time.perf_counter() - started)
+        return len(found), len(queries), min(timings) * 1000, sum(timings) / len(timings) * 1000
+
+    def run(self, hub, destination, repeat):
+        day = (timezone.now() + timedelta(days=2)).date()
+        cases = (
+            ('from hub', {'departure_city': hub.id}),
+            ('from hub to point', {'departure_city': hub.id, 'arrival_city': destination.id}),
+            ('from hub on day', {'departure_city': hub.id, 'departure_day': day}),
+        )
+        self.stdout.write(f"{'case':<20}{'impl':<8}{'routes':>8}{'queries':>9}{'min ms':>10}{'avg ms':>10}")
+        for name, params in cases:
+            implementations = (
+                ('legacy', lambda: legacy_search_routes(**params)),
+                ('set', lambda: search_routes(params['departure_city'], params.get('arrival_city'), params.get('departure_day'))),
+            )
+            for label, func in implementations:
+                found, queries, best, average = self.measure(func, repeat)
+                self.stdout.write(f'{name:<20}{label:<8}{found:>8}{queries:>9}{best:>10.1f}{average:>10.1f}')
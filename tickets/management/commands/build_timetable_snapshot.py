@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tickets.timetable import build_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Write the memory-mapped timetable snapshot the journey planner of every worker reads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='Snapshot file, TIMETABLE_SNAPSHOT_PATH by default')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running and write a new snapshot every INTERVAL seconds')
+        parser.add_argument('--delay', type=int, default=0,
+                            help='Wait DELAY seconds before the first snapshot, when one was just written')
+
+    def handle(self, *args, **options):
+        time.sleep(options['delay'])
+        while True:
+            version = build_snapshot(options['path'])
+            self.stdout.write(f'Wrote timetable snapshot at change log version {version}')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
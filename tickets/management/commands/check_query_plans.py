@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from tickets.inventory import seats_filter
+from tickets.models import Order, Route, RouteToArrivalPoint, Ticket
+from tickets.search import search_routes
+
+
+def _hot_queries():
+    """
+    (description, queryset, index names any of which the plan must use) for the main endpoint queries.
+
+    The querysets are built the way the endpoints build them. Indexes Django creates for foreign keys are matched by
+    the prefix of their generated names.
+    """
+    now = timezone.now()
+    order_tickets = Ticket.objects.with_details(lightweight=True).filter(order__in=[1])
+    return [
+        ('tickets of orders', order_tickets, ('tickets_ticket_order_id', )),
+        ('ticket arrival time', order_tickets, ('routestop_route_point_idx', )),
+        ('expired holds of seats', Ticket.objects.filter(seats_filter([(1, 1)])).expired_holds(),
+         ('tickets_ticket_carriage_id', )),
+        ('route stops', RouteToArrivalPoint.objects.filter(route__in=[1]).order_by('order'),
+         ('routestop_route_order_idx', )),
+        ('route list page', Route.objects.with_stops().filter(departure_time__gte=now).order_by('departure_time', 'id')[:51],
+         ('route_departure_time_idx', )),
+        ('route search', search_routes(departure_point=1, arrival_point=2),
+         ('routeleg_points_time_idx', )),
+        ('pending order of user', Order.objects.select_for_update().filter(order_status='pending', user=1),
+         ('order_pending_user_idx', 'order_user_status_idx')),
+        ('orders by status', Order.objects.filter(user=1, order_status='success'),
+         ('order_user_status_idx', )),
+        ('expired holds', Order.objects.expired(),
+         ('order_pending_expiry_idx', )),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot endpoint queries and fail unless the planner uses the expected indexes'
+
+    def handle(self, *args, **options):
+        failed = []
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # Dev databases are small enough for sequential scans to always win,
+                # check that the indexes are usable rather than what a tiny table costs.
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+
+            for description, queryset, indexes in _hot_queries():
+                plan = queryset.explain()
+                if any(index in plan for index in indexes):
+                    self.stdout.write(f'OK    {description}')
+                else:
+                    failed.append(description)
+                    self.stdout.write(f'FAIL  {description}, expected {" or ".join(indexes)}:\n{plan}')
+
+        if failed:
+            raise CommandError(f'{len(failed)} queries do not use their index: {", ".join(failed)}')
+        self.stdout.write(self.style.SUCCESS('All hot queries use their indexes'))
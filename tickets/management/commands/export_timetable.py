@@ -0,0 +1,23 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tickets.models import Route
+from tickets.timetable_files import export_timetable
+
+
+class Command(BaseCommand):
+    help = 'Export routes, stops and carriages as a timetable CSV file, see `tickets.timetable_files`'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='Output file, standard output by default')
+        parser.add_argument('--upcoming', action='store_true', help='Only routes that have not departed yet')
+
+    def handle(self, *args, **options):
+        routes = Route.objects.filter(departure_time__gte=timezone.now()) if options['upcoming'] else Route.objects.all()
+        if not options['path']:
+            sys.stdout.writelines(export_timetable(routes))
+            return
+        with open(options['path'], 'w', newline='', encoding='utf-8') as file:
+            file.writelines(export_timetable(routes))
@@ -0,0 +1,242 @@
+import itertools
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from tickets.cache import invalidate_responses
+from tickets.inventory import MAX_ROUTE_SEGMENTS, reconcile_seat_counters, segment_mask
+from tickets.models import City, ArrivalPoint, Route, RouteToArrivalPoint, CarriageType, Carriage, CarriageSeat, \
+    Ticket, Order
+from tickets.route_index import rebuild_route_legs
+from tickets.timetable import build_snapshot
+from users.models import User
+
+TIME_ZONES = ('Europe/Kyiv', 'Europe/Warsaw', 'Europe/Berlin', 'Europe/London')
+CARRIAGE_SEATS = {'platzkart': 54, 'coupe': 36, 'seated': 60}
+# Routes running the same line, so stations are shared and searches and transfers find several trains
+ROUTES_PER_LINE = 25
+# Tickets per order and how often an order has each count
+ORDER_SIZES = ((1, 2, 3, 4), (60, 25, 10, 5))
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with a synthetic railway network for load tests and benchmarks. Use a scratch '
+            'database, generated rows are only told apart by the --prefix of city names and user emails.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cities', type=int, default=2000)
+        parser.add_argument('--routes', type=int, default=20000)
+        parser.add_argument('--min-stops', type=int, default=5)
+        parser.add_argument('--max-stops', type=int, default=30)
+        parser.add_argument('--carriages', type=int, default=6, help='Carriages per route')
+        parser.add_argument('--tickets', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--days', type=int, default=30, help='Routes depart within this many days from now')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='synthetic')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if not 1 <= options['min_stops'] <= options['max_stops'] <= MAX_ROUTE_SEGMENTS:
+            raise CommandError(f'Routes need between 1 and {MAX_ROUTE_SEGMENTS} stops')
+        if options['cities'] <= options['max_stops']:
+            raise CommandError('A route cannot have more stops than there are cities')
+
+        self.rnd = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.started = time.perf_counter()
+
+        points = self.create_points(options['cities'], options['prefix'])
+        routes = self.create_routes(points, options)
+        carriages = self.create_carriages(routes, options['carriages'])
+        users = self.create_users(options['users'], options['prefix'])
+        occupied = self.create_tickets(routes, carriages, users, options['tickets'])
+        self.create_seats(carriages, occupied)
+        self.count_taken_seats(carriages)
+        self.create_route_legs(routes)
+
+        invalidate_responses(City, ArrivalPoint, Route, RouteToArrivalPoint, CarriageType, Carriage, Ticket, Order)
+        version = build_snapshot()
+        self.log(f'Wrote timetable snapshot at change log version {version}')
+
+    def log(self, message):
+        self.stdout.write(f'[{time.perf_counter() - self.started:7.1f}s] {message}')
+
+    def batches(self, objects):
+        iterator = iter(objects)
+        while batch := list(itertools.islice(iterator, self.batch_size)):
+            yield batch
+
+    def create_points(self, count, prefix):
+        cities = []
+        for batch in self.batches(City(city_name=f'{prefix}-{number}'[:32], timezone=self.rnd.choice(TIME_ZONES))
+                                  for number in range(count)):
+            cities += City.objects.bulk_create(batch)
+        points = []
+        for batch in self.batches(ArrivalPoint(arrival_city=city, arrival_place='Central station') for city in cities):
+            points += [point.id for point in ArrivalPoint.objects.bulk_create(batch)]
+        self.log(f'{len(cities)} cities and arrival points')
+        return points
+
+    def plan_lines(self, points, count, min_stops, max_stops):
+        """
+        Lines as (stations, minutes from the first station, price from the first station in cents).
+
+        Stations are drawn with Zipf-like weights, so a few big cities are on many lines like real hubs are.
+        """
+        cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(points) + 1)))
+        lines = []
+        for _ in range(count):
+            length = self.rnd.randint(min_stops, max_stops) + 1
+            stations = {}
+            while len(stations) < length:
+                stations.update(dict.fromkeys(self.rnd.choices(points, cum_weights=cum_weights, k=length)))
+            stations = list(stations)[:length]
+            segments = [self.rnd.randint(20, 120) for _ in range(length - 1)]
+            fares = [minutes * self.rnd.randint(8, 25) for minutes in segments]
+            lines.append((stations, segments, fares))
+        return lines
+
+    def create_routes(self, points, options):
+        """
+        Create routes running random lines in either direction at random times.
+
+        :return: list of (route id, stop point ids with the departure city first, cumulative prices in cents)
+        """
+        lines = self.plan_lines(points, max(options['routes'] // ROUTES_PER_LINE, 1), options['min_stops'], options['max_stops'])
+        start = timezone.now().replace(second=0, microsecond=0) + timedelta(hours=1)
+        routes = []
+        for batch in self.batches(range(options['routes'])):
+            trips = []
+            for _ in batch:
+                stations, segments, fares = self.rnd.choice(lines)
+                if self.rnd.random() < 0.5:
+                    stations, segments, fares = stations[::-1], segments[::-1], fares[::-1]
+                departure_time = start + timedelta(minutes=5 * self.rnd.randrange(options['days'] * 24 * 12))
+                trips.append((Route(departure_city_id=stations[0], departure_time=departure_time), stations,
+                              [0, *itertools.accumulate(segments)], [0, *itertools.accumulate(fares)]))
+
+            Route.objects.bulk_create([route for route, *_ in trips])
+            RouteToArrivalPoint.objects.bulk_create(
+                (RouteToArrivalPoint(route=route, arrival_point_id=stations[order], order=order,
+                                     price=Decimal(prices[order]) / 100,
+                                     arrival_time=route.departure_time + timedelta(minutes=minutes[order]))
+                 for route, stations, minutes, prices in trips for order in range(1, len(stations))),
+                batch_size=self.batch_size,
+            )
+            routes += [(route.id, stations, prices) for route, stations, minutes, prices in trips]
+        self.log(f'{len(routes)} routes on {len(lines)} lines')
+        return routes
+
+    def create_carriages(self, routes, per_route):
+        """:return: carriages of every route as (carriage id, seat amount), in the order of ``routes``"""
+        carriage_types = [CarriageType.objects.get_or_create(carriage_type_name=name)[0] for name in CARRIAGE_SEATS]
+        carriages = []
+        for batch in self.batches(routes):
+            created = Carriage.objects.bulk_create(
+                Carriage(route_id=route_id, carriage_type=carriage_type, seat_amount=CARRIAGE_SEATS[carriage_type.carriage_type_name])
+                for route_id, *_ in batch for carriage_type in itertools.islice(itertools.cycle(carriage_types), per_route)
+            )
+            carriages += [[(carriage.id, carriage.seat_amount) for carriage in created[index:index + per_route]]
+                          for index in range(0, len(created), per_route)]
+        self.log(f'{len(routes) * per_route} carriages')
+        return carriages
+
+    def create_users(self, count, prefix):
+        password = make_password(None)
+        users = []
+        for batch in self.batches(User(email=f'{prefix}-{number}@example.com', username=f'{prefix}-{number}', password=password)
+                                  for number in range(count)):
+            users += [user.id for user in User.objects.bulk_create(batch)]
+        self.log(f'{len(users)} users')
+        return users
+
+    def plan_order(self, routes, carriages, occupied):
+        """Pick a leg of a random route and free seats on it in one carriage, or ``None`` if the seats are taken."""
+        index = self.rnd.randrange(len(routes))
+        route_id, stations, prices = routes[index]
+        departure, arrival = sorted(self.rnd.sample(range(len(stations)), 2))
+        mask = segment_mask(departure, arrival)
+        carriage_id, seat_amount = self.rnd.choice(carriages[index])
+        size = self.rnd.choices(*ORDER_SIZES)[0]
+        first_seat = self.rnd.randint(1, max(seat_amount - size + 1, 1))
+        seats = [seat for seat in range(first_seat, min(first_seat + size, seat_amount + 1))
+                 if not occupied.get((carriage_id, seat), 0) & mask]
+        if not seats:
+            return None
+        return [Ticket(price=Decimal(prices[arrival] - prices[departure]) / 100, seat_number=seat, carriage_id=carriage_id,
+                       departure_point_id=stations[departure], arrival_point_id=stations[arrival], segment_mask=mask)
+                for seat in seats]
+
+    def create_tickets(self, routes, carriages, users, count):
+        """
+        Sell ``count`` seats in orders of one to four tickets on one leg.
+
+        Most orders are paid, users may also have one pending order, some of them with an expired seat hold.
+        Failed orders are added without tickets, like the ones whose hold was released.
+
+        :return: segment bitmap of every sold seat by (carriage id, seat number)
+        """
+        now = timezone.now()
+        occupied = {}
+        pending_users = set()
+        sold = misses = 0
+        while sold < count:
+            orders, tickets = [], []
+            while sold + len(tickets) < count and len(tickets) < self.batch_size:
+                if (planned := self.plan_order(routes, carriages, occupied)) is None:
+                    misses += 1
+                    if misses > count:
+                        raise CommandError(f'Sold out after {sold + len(tickets)} tickets, add routes or carriages')
+                    continue
+                planned = planned[:count - sold - len(tickets)]
+                for ticket in planned:
+                    occupied[(ticket.carriage_id, ticket.seat_number)] = occupied.get((ticket.carriage_id, ticket.seat_number), 0) | ticket.segment_mask
+
+                user = self.rnd.choice(users)
+                order = Order(user_id=user, order_status='success', total_price=sum(ticket.price for ticket in planned))
+                if user not in pending_users and self.rnd.random() < 0.05:
+                    pending_users.add(user)
+                    order.order_status = 'pending'
+                    order.expires_at = now + timedelta(minutes=self.rnd.randint(-30, 15))
+                orders.append(order)
+                if self.rnd.random() < 0.1:
+                    orders.append(Order(user_id=user, order_status='fail', total_price=order.total_price))
+                tickets += [(order, ticket) for ticket in planned]
+
+            Order.objects.bulk_create(orders)
+            for order, ticket in tickets:
+                ticket.order_id = order.id
+            Ticket.objects.bulk_create(ticket for _, ticket in tickets)
+            sold += len(tickets)
+            self.log(f'{sold} tickets')
+        return occupied
+
+    def create_seats(self, carriages, occupied):
+        seats = (CarriageSeat(carriage_id=carriage_id, seat_number=seat, occupied_segments=occupied.get((carriage_id, seat), 0))
+                 for route_carriages in carriages for carriage_id, seat_amount in route_carriages
+                 for seat in range(1, seat_amount + 1))
+        created = 0
+        for batch in self.batches(seats):
+            CarriageSeat.objects.bulk_create(batch)
+            created += len(batch)
+        self.log(f'{created} carriage seats')
+
+    def count_taken_seats(self, carriages):
+        carriage_ids = [carriage_id for route_carriages in carriages for carriage_id, _ in route_carriages]
+        for batch in self.batches(carriage_ids):
+            reconcile_seat_counters(Carriage.objects.filter(id__in=batch))
+        self.log(f'Taken seat counters of {len(carriage_ids)} carriages')
+
+    def create_route_legs(self, routes):
+        # Legs grow with the square of the stops, a few hundred routes make a batch of legs already
+        route_ids = [route_id for route_id, *_ in routes]
+        step = max(self.batch_size // 20, 1)
+        for start in range(0, len(route_ids), step):
+            rebuild_route_legs(route_ids[start:start + step])
+        self.log(f'Route legs of {len(route_ids)} routes')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework import serializers
+
+from tickets.timetable_files import import_timetable
+
+
+class Command(BaseCommand):
+    help = ('Import routes, stops and carriages from a timetable CSV file, see `tickets.timetable_files`. '
+            'Run it again on the same file to resume an interrupted import.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=500, help='Trips imported per transaction')
+
+    def handle(self, *args, **options):
+        def progress(created, skipped):
+            self.stdout.write(f'{created} routes created, {skipped} imported before')
+
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as file:
+                created, skipped = import_timetable(file, options['batch_size'], progress)
+        except serializers.ValidationError as error:
+            raise CommandError(error.detail['file'])
+        self.stdout.write(self.style.SUCCESS(f'Imported {created} routes, skipped {skipped} imported before'))
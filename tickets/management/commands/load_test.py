@@ -0,0 +1,74 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from tickets.models import RouteLeg
+from users.models import User
+
+
+def _percentile(latencies, percent):
+    return latencies[max(math.ceil(len(latencies) * percent / 100) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = ('Compare throughput and latency of the read endpoints served by WSGI and by their async variants '
+            'under ASGI. Start both servers first, e.g. `gunicorn railway_tickets.wsgi -b 127.0.0.1:8000` and '
+            '`uvicorn railway_tickets.asgi:application --port 8001`.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--asgi-url', default='http://127.0.0.1:8001')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint and server')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--email', help='User to authenticate as, the first active user by default')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(is_active=True)
+        user = (user.filter(email=options['email']) if options['email'] else user.order_by('id')).first()
+        if user is None:
+            raise CommandError('No user to authenticate as')
+        leg = RouteLeg.objects.filter(departure_time__gte=timezone.now()).order_by('departure_time').first()
+        if leg is None:
+            raise CommandError('No upcoming route to query')
+
+        headers = {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+        search = {'departure_city': str(leg.departure_point_id), 'arrival_city': str(leg.arrival_point_id)}
+        carriages = f'routes/{leg.route_id}/carriages/?departure_point={leg.departure_point_id}&arrival_point={leg.arrival_point_id}'
+        endpoints = (
+            ('route search', 'POST', 'routes/search/', search),
+            ('route carriages', 'GET', carriages, None),
+            ('cities', 'GET', 'cities/', None),
+        )
+
+        self.stdout.write(f'{"endpoint":<16} {"server":<6} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8} {"errors":>6}')
+        for name, method, path, body in endpoints:
+            for server, url in (('wsgi', f'{options["wsgi_url"]}/api/{path}'),
+                                ('asgi', f'{options["asgi_url"]}/api/async/{path}')):
+                throughput, latencies, errors = self.run(method, url, body, headers, options['requests'], options['concurrency'])
+                self.stdout.write(f'{name:<16} {server:<6} {throughput:>8.1f} {_percentile(latencies, 50):>8.1f} '
+                                  f'{_percentile(latencies, 99):>8.1f} {errors:>6}')
+
+    def run(self, method, url, body, headers, total, concurrency):
+        sessions = threading.local()
+
+        def send(_):
+            if not hasattr(sessions, 'session'):
+                sessions.session = requests.Session()
+            started = time.perf_counter()
+            try:
+                ok = sessions.session.request(method, url, json=body, headers=headers, timeout=30).ok
+            except requests.RequestException:
+                ok = False
+            return (time.perf_counter() - started) * 1000, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(send, range(total)))
+        elapsed = time.perf_counter() - started
+        return total / elapsed, sorted(latency for latency, _ in results), sum(not ok for _, ok in results)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from tickets.models import Route
+from tickets.route_index import rebuild_route_legs
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the origin/destination leg index for all or the given routes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('route_ids', nargs='*', type=int)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        route_ids = options['route_ids'] or list(Route.objects.order_by('id').values_list('id', flat=True))
+        batch_size = options['batch_size']
+        for start in range(0, len(route_ids), batch_size):
+            rebuild_route_legs(route_ids[start:start + batch_size])
+            self.stdout.write(f'Rebuilt legs for {min(start + batch_size, len(route_ids))}/{len(route_ids)} routes')
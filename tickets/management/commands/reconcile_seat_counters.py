@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tickets.inventory import reconcile_seat_counters, seat_counter_drift
+from tickets.models import Carriage
+
+
+class Command(BaseCommand):
+    help = 'Find carriages whose taken seat counter does not match their occupied seats and repair the counter'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Only report the drift')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running and reconcile the counters every INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            drifted = self.reconcile(options['batch_size'], options['dry_run'])
+            self.stdout.write(f'{"Found" if options["dry_run"] else "Repaired"} {drifted} drifted carriages')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def reconcile(self, batch_size, dry_run):
+        drifted, last_id = 0, 0
+        while batch := list(Carriage.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]):
+            carriages = Carriage.objects.filter(id__in=batch)
+            drift = seat_counter_drift(carriages) if dry_run else reconcile_seat_counters(carriages)
+            for carriage_id, (taken_seats, occupied_seats) in sorted(drift.items()):
+                self.stdout.write(f'Carriage {carriage_id}: counted {taken_seats} taken seats, has {occupied_seats} occupied')
+            drifted, last_id = drifted + len(drift), batch[-1]
+        return drifted
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tickets.models import Order
+from tickets.reservations import release_orders
+
+
+class Command(BaseCommand):
+    help = 'Fail pending orders whose seat hold has expired and give their seats back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running and release expired holds every INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            released = self.release(options['batch_size'])
+            self.stdout.write(f'Released {released} expired orders')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def release(self, batch_size):
+        released = 0
+        while True:
+            batch = Order.objects.expired().order_by('expires_at').values_list('id', flat=True)[:batch_size]
+            if not (count := release_orders(Order.objects.expired().filter(id__in=list(batch)))):
+                return released
+            released += count
@@ -0,0 +1,187 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from tickets.cache import RESPONSE_CACHE_ALIAS
+from tickets.models import Route, RouteLeg, Carriage, CarriageSeat, Ticket, Order
+from tickets.payments import get_gateway
+from users.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(round(len(values) * percent / 100), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Measure latency, SQL queries and memory of the main endpoints on the current data, e.g. a '
+            '`generate_dataset` network, and save them as JSON. Everything the requests write is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--compare', help='Earlier results to print the change against')
+        parser.add_argument('--label', default='', help='Version or change the results belong to')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--email', help='User to run as, the one with most orders by default')
+
+    def handle(self, *args, **options):
+        results = {
+            'label': options['label'],
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'repeat': options['repeat'],
+            'dataset': {model.__name__: model.objects.count() for model in (Route, RouteLeg, Carriage, Ticket, Order, User)},
+            'endpoints': {},
+        }
+        # Measures building responses rather than reading them from the cache, and buying reaches the payment
+        # provider otherwise
+        caches = {**settings.CACHES, RESPONSE_CACHE_ALIAS: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        with override_settings(CACHES=caches, PAYMENT_GATEWAY='tickets.payments.FakeGateway', PAYMENT_TIMEOUT=None):
+            get_gateway.cache_clear()
+            try:
+                with transaction.atomic():
+                    for name, request, prepare in self.cases(options):
+                        results['endpoints'][name] = self.measure(request, prepare, options['repeat'], options['warmup'])
+                        self.report(name, results['endpoints'][name])
+                    raise Rollback
+            except Rollback:
+                pass
+            finally:
+                get_gateway.cache_clear()
+
+        with open(options['output'], 'w') as file:
+            json.dump(results, file, indent=2)
+        self.stdout.write(f'Saved to {options["output"]}')
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def cases(self, options):
+        """
+        Yield (name, request, prepare) for every endpoint, ``prepare`` resets state before each request.
+
+        Requests run in this order, ticket create leaves the pending order that buy pays for.
+        """
+        users = User.objects.filter(email=options['email']) if options['email'] else \
+            User.objects.annotate(order_count=Count('orders')).order_by('-order_count')
+        if (user := users.first()) is None:
+            raise CommandError('No user to run as, generate a dataset first')
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(user)
+
+        busiest = (RouteLeg.objects.filter(departure_time__gte=timezone.now()).values('departure_point', 'arrival_point')
+                   .annotate(routes=Count('id')).order_by('-routes').first())
+        if busiest is None:
+            raise CommandError('No upcoming routes, generate a dataset first')
+        leg = RouteLeg.objects.filter(departure_point=busiest['departure_point'], arrival_point=busiest['arrival_point'],
+                                      departure_time__gte=timezone.now()).order_by('departure_time').first()
+        search = {'departure_city': leg.departure_point_id, 'arrival_city': leg.arrival_point_id}
+        carriages = f'/api/routes/{leg.route_id}/carriages/?departure_point={leg.departure_point_id}&arrival_point={leg.arrival_point_id}'
+
+        # One seat for every warmup, timed and traced request
+        free_seats = iter(CarriageSeat.objects.filter(carriage__route=leg.route_id, occupied_segments=0)
+                          .values_list('carriage', 'seat_number')[:options['warmup'] + options['repeat'] + 1])
+
+        def book():
+            try:
+                carriage, seat_number = next(free_seats)
+            except StopIteration:
+                raise CommandError(f'Route {leg.route_id} has too few free seats to book, lower --repeat')
+            return client.post('/api/tickets/', {'departure_point': leg.departure_point_id, 'arrival_point': leg.arrival_point_id,
+                                                 'carriage': carriage, 'seat_number': seat_number}, format='json')
+
+        def pending_order():
+            return Order.objects.filter(user=user, order_status='pending').first()
+
+        def forget_payment_intent():
+            # Measures creating the intent, repeated buys of the same amount only read it back
+            Order.objects.filter(user=user, order_status='pending').update(payment_intent_id=None, payment_client_secret=None,
+                                                                          payment_amount=None)
+
+        yield 'search', lambda: client.post('/api/routes/search/', search, format='json'), None
+        yield 'route list', lambda: client.get('/api/routes/'), None
+        yield 'carriages', lambda: client.get(carriages), None
+        yield 'board', lambda: client.get(f'/api/arrival_points/{leg.departure_point_id}/board/'), None
+        yield 'ticket create', book, None
+        yield 'order list', lambda: client.get('/api/orders/'), None
+        yield 'buy', lambda: client.post(f'/api/orders/{pending_order().id}/buy/', {}, format='json'), forget_payment_intent
+
+    def measure(self, request, prepare, repeat, warmup):
+        """
+        Time ``repeat`` requests, then count queries and peak Python memory in one more.
+
+        Queries and memory are traced in their own request, tracing slows down the timed ones otherwise.
+        """
+        def prepared_request():
+            if prepare:
+                prepare()
+            started = time.perf_counter()
+            response = request()
+            if response.status_code >= 400:
+                raise CommandError(f'{response.status_code} response: {response.data}')
+            return response, (time.perf_counter() - started) * 1000
+
+        for _ in range(warmup):
+            prepared_request()
+        response, latencies = None, []
+        for _ in range(repeat):
+            response, latency = prepared_request()
+            latencies.append(latency)
+
+        if prepare:
+            prepare()
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                request()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'status': response.status_code,
+            'latency_ms': {
+                'min': round(min(latencies), 3),
+                'p50': round(statistics.median(latencies), 3),
+                'p95': round(_percentile(latencies, 95), 3),
+                'max': round(max(latencies), 3),
+                'mean': round(statistics.mean(latencies), 3),
+            },
+            'queries': len(queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def report(self, name, result):
+        latency = result['latency_ms']
+        self.stdout.write(f'{name:<14} p50 {latency["p50"]:>9.2f} ms  p95 {latency["p95"]:>9.2f} ms  '
+                          f'{result["queries"]:>4} queries  {result["peak_memory_kb"]:>9.1f} KB')
+
+    def compare(self, path, results):
+        with open(path) as file:
+            previous = json.load(file)
+        self.stdout.write(f'Change against {previous.get("label") or path}:')
+        for name, result in results['endpoints'].items():
+            if (before := previous['endpoints'].get(name)) is None:
+                continue
+            p50 = (result['latency_ms']['p50'] - before['latency_ms']['p50']) / before['latency_ms']['p50'] * 100
+            memory = result['peak_memory_kb'] - before['peak_memory_kb']
+            self.stdout.write(f'{name:<14} p50 {p50:>+7.1f} %  queries {result["queries"] - before["queries"]:>+4}  '
+                              f'memory {memory:>+9.1f} KB')
@@ -0,0 +1,64 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from tickets.models import Order
+from users.models import Discount, DiscountType, User
+
+
+class Command(BaseCommand):
+    help = 'Redeem one limited discount from many concurrent PATCH /api/orders/<id>/ requests and verify its limit holds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=100)
+        parser.add_argument('--threads', type=int, default=50)
+        parser.add_argument('--limit', type=int, default=5)
+        parser.add_argument('--percent', type=float, default=10.0)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated user, discount and orders')
+
+    def handle(self, *args, **options):
+        user, discount_type, discount, orders = self.seed(options)
+        try:
+            with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                statuses = Counter(pool.map(lambda order: self.redeem(user, order, discount), orders))
+            self.stdout.write(f'Responses: {dict(statuses)}')
+            self.verify(options, discount, orders, statuses)
+        finally:
+            if not options['keep']:
+                user.delete()
+                discount_type.delete()
+
+    def seed(self, options):
+        suffix = timezone.now().strftime('%H%M%S%f')
+        user = User.objects.create_user(email=f'discount-stress-{suffix}@example.com', username='discount-stress', password=None)
+        discount_type = DiscountType.objects.create(discount_type_name='limited', discount_percent=options['percent'],
+                                                    discount_limit=options['limit'])
+        discount = Discount.objects.create(discount_type=discount_type, user=user)
+        orders = Order.objects.bulk_create(Order(user=user, order_status='pending', total_price=Decimal(100))
+                                           for _ in range(options['orders']))
+        return user, discount_type, discount, orders
+
+    def redeem(self, user, order, discount):
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(user)
+        try:
+            return client.patch(f'/api/orders/{order.id}/', {'order_status': 'success', 'discount_id': discount.id},
+                                format='json').status_code
+        finally:
+            connection.close()
+
+    def verify(self, options, discount, orders, statuses):
+        discounted_price = Decimal(100) * (100 - Decimal(str(options['percent']))) / 100
+        prices = Counter(Order.objects.filter(id__in=[order.id for order in orders]).values_list('total_price', flat=True))
+        discounted = sum(count for price, count in prices.items() if price == discounted_price)
+        usage = Discount.objects.filter(pk=discount.pk).values_list('usage_amount', flat=True).first()
+        expected = min(options['limit'], len(orders))
+        self.stdout.write(f'Discounted orders: {discounted}, successful redemptions: {statuses[200]}, '
+                          f'discount usage: {"deleted" if usage is None else usage}, limit: {options["limit"]}')
+        if discounted != expected or statuses[200] != expected or (usage is not None and usage > options['limit']):
+            raise CommandError('The discount limit did not hold')
@@ -0,0 +1,89 @@
+import random
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from tickets.models import City, ArrivalPoint, Route, RouteToArrivalPoint, CarriageType, Carriage, CarriageSeat, Ticket
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Fire concurrent POST /api/tickets/ requests at one carriage and verify that no seat segment is sold twice'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument('--threads', type=int, default=50)
+        parser.add_argument('--seats', type=int, default=20)
+        parser.add_argument('--stops', type=int, default=6)
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated route, users and tickets')
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        route, carriage, points, users = self.seed(options)
+        payloads = []
+        for _ in range(options['requests']):
+            departure, arrival = sorted(rnd.sample(range(len(points)), 2))
+            payloads.append((rnd.choice(users), {
+                'departure_point': points[departure].id,
+                'arrival_point': points[arrival].id,
+                'carriage': carriage.id,
+                'seat_number': rnd.randint(1, options['seats']),
+            }))
+
+        try:
+            with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                statuses = Counter(pool.map(self.book, payloads))
+            self.stdout.write(f'Responses: {dict(statuses)}')
+            self.verify(carriage)
+        finally:
+            if not options['keep']:
+                route.delete()
+                User.objects.filter(id__in=[user.id for user in users]).delete()
+                City.objects.filter(id__in=[point.arrival_city_id for point in points]).delete()
+
+    def seed(self, options):
+        suffix = timezone.now().strftime('%H%M%S%f')
+        cities = [City.objects.create(city_name=f'stress-{suffix}-{i}'[:32]) for i in range(options['stops'] + 1)]
+        points = [ArrivalPoint.objects.create(arrival_city=city, arrival_place='Central') for city in cities]
+        departure_time = timezone.now() + timedelta(days=1)
+        route = Route.objects.create(departure_city=points[0], departure_time=departure_time)
+        for order, point in enumerate(points[1:], start=1):
+            RouteToArrivalPoint.objects.create(route=route, arrival_point=point, order=order, price=Decimal(order * 10),
+                                               arrival_time=departure_time + timedelta(hours=order))
+        carriage_type = CarriageType.objects.get_or_create(carriage_type_name='seated')[0]
+        carriage = Carriage.objects.create(route=route, carriage_type=carriage_type, seat_amount=options['seats'])
+        users = [User.objects.create_user(email=f'stress-{suffix}-{i}@example.com', username=f'stress-{i}', password=None)
+                 for i in range(options['users'])]
+        return route, carriage, points, users
+
+    def book(self, payload):
+        user, data = payload
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(user)
+        try:
+            return client.post('/api/tickets/', data, format='json').status_code
+        finally:
+            connection.close()
+
+    def verify(self, carriage):
+        tickets = Ticket.objects.filter(carriage=carriage).values_list('seat_number', 'segment_mask')
+        sold = {}
+        double_booked = 0
+        for seat_number, mask in tickets:
+            if sold.get(seat_number, 0) & mask:
+                double_booked += 1
+            sold[seat_number] = sold.get(seat_number, 0) | mask
+
+        bitmaps = dict(CarriageSeat.objects.filter(carriage=carriage).values_list('seat_number', 'occupied_segments'))
+        drifted = [seat for seat, bitmap in bitmaps.items() if bitmap != sold.get(seat, 0)]
+        self.stdout.write(f'Tickets sold: {len(tickets)}, double bookings: {double_booked}, bitmap drift: {len(drifted)}')
+        if double_booked or drifted:
+            raise CommandError('Seat inventory is inconsistent')
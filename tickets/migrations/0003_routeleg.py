@@ -0,0 +1,61 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_route_legs(apps, schema_editor):
+    Route = apps.get_model('tickets', 'Route')
+    RouteLeg = apps.get_model('tickets', 'RouteLeg')
+    RouteToArrivalPoint = apps.get_model('tickets', 'RouteToArrivalPoint')
+
+    stops = {}
+    for stop in RouteToArrivalPoint.objects.order_by('route', 'order').iterator():
+        stops.setdefault(stop.route_id, []).append(stop)
+
+    legs = []
+    for route in Route.objects.iterator():
+        boarding_points = [(0, route.departure_city_id, route.departure_time, 0)]
+        boarding_points += [(stop.order, stop.arrival_point_id, stop.arrival_time, stop.price) for stop in stops.get(route.id, [])]
+        for index, (departure_order, departure_point, departure_time, departure_price) in enumerate(boarding_points):
+            for arrival_order, arrival_point, arrival_time, arrival_price in boarding_points[index + 1:]:
+                legs.append(RouteLeg(
+                    route_id=route.id,
+                    departure_point_id=departure_point,
+                    arrival_point_id=arrival_point,
+                    departure_order=departure_order,
+                    arrival_order=arrival_order,
+                    price=arrival_price - departure_price,
+                    departure_time=departure_time,
+                    arrival_time=arrival_time,
+                ))
+    RouteLeg.objects.bulk_create(legs, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0002_auto_20221210_2131'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteLeg',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('departure_order', models.IntegerField()),
+                ('arrival_order', models.IntegerField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('departure_time', models.DateTimeField()),
+                ('arrival_time', models.DateTimeField()),
+                ('arrival_point', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tickets.arrivalpoint')),
+                ('departure_point', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tickets.arrivalpoint')),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='legs', to='tickets.route')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['departure_point', 'arrival_point', 'departure_time'], name='routeleg_points_time_idx'),
+                    models.Index(fields=['route', 'departure_point', 'arrival_point'], name='routeleg_route_points_idx'),
+                ],
+            },
+        ),
+        migrations.RunPython(build_route_legs, migrations.RunPython.noop),
+    ]
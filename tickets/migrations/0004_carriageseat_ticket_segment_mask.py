@@ -0,0 +1,56 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_seat_inventory(apps, schema_editor):
+    Carriage = apps.get_model('tickets', 'Carriage')
+    CarriageSeat = apps.get_model('tickets', 'CarriageSeat')
+    RouteLeg = apps.get_model('tickets', 'RouteLeg')
+    Ticket = apps.get_model('tickets', 'Ticket')
+
+    occupied = {}
+    for ticket in Ticket.objects.select_related('carriage').iterator():
+        leg = RouteLeg.objects.filter(route=ticket.carriage.route_id, departure_point=ticket.departure_point_id,
+                                      arrival_point=ticket.arrival_point_id).first()
+        if not leg:
+            continue
+        ticket.segment_mask = ((1 << (leg.arrival_order - leg.departure_order)) - 1) << leg.departure_order
+        ticket.save(update_fields=['segment_mask'])
+        seat = (ticket.carriage_id, ticket.seat_number)
+        occupied[seat] = occupied.get(seat, 0) | ticket.segment_mask
+
+    seats = []
+    for carriage in Carriage.objects.iterator():
+        for number in range(1, carriage.seat_amount + 1):
+            seats.append(CarriageSeat(carriage_id=carriage.id, seat_number=number,
+                                      occupied_segments=occupied.get((carriage.id, number), 0)))
+    CarriageSeat.objects.bulk_create(seats, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0003_routeleg'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='segment_mask',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='CarriageSeat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seat_number', models.IntegerField()),
+                ('occupied_segments', models.BigIntegerField(default=0)),
+                ('carriage', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seats', to='tickets.carriage')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='carriageseat',
+            constraint=models.UniqueConstraint(fields=('carriage', 'seat_number'), name='unique_carriage_seat'),
+        ),
+        migrations.RunPython(build_seat_inventory, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def expire_pending_orders(apps, schema_editor):
+    Order = apps.get_model('tickets', 'Order')
+    Order.objects.filter(order_status='pending', expires_at=None).update(expires_at=timezone.now() + settings.SEAT_HOLD_TTL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0004_carriageseat_ticket_segment_mask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(expire_pending_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0005_order_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'order_status'], name='order_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('order_status', 'pending')), fields=['user'], name='order_pending_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('order_status', 'pending')), fields=['expires_at'], name='order_pending_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['departure_time', 'id'], name='route_departure_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='routetoarrivalpoint',
+            index=models.Index(fields=['route', 'order'], name='routestop_route_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='routetoarrivalpoint',
+            index=models.Index(fields=['route', 'arrival_point'], name='routestop_route_point_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['carriage', 'seat_number', 'arrival_point'], name='ticket_carriage_seat_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.db import migrations, models
+import tickets.timewindows
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0006_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='city',
+            name='timezone',
+            field=models.CharField(default=settings.TIME_ZONE, max_length=64, validators=[tickets.timewindows.validate_timezone]),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_taken_seats(apps, schema_editor):
+    Carriage = apps.get_model('tickets', 'Carriage')
+    Ticket = apps.get_model('tickets', 'Ticket')
+
+    tickets = Ticket.objects.filter(carriage=OuterRef('pk')).order_by().values('carriage').annotate(count=Count('id'))
+    Carriage.objects.update(taken_seats=Coalesce(Subquery(tickets.values('count')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0009_route_external_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carriage',
+            name='taken_seats',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_taken_seats, migrations.RunPython.noop),
+    ]
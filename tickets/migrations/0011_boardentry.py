@@ -0,0 +1,70 @@
+from django.db import migrations, models
+from django.db.models import F, Sum
+import django.db.models.deletion
+
+
+def build_board_entries(apps, schema_editor):
+    BoardEntry = apps.get_model('tickets', 'BoardEntry')
+    Carriage = apps.get_model('tickets', 'Carriage')
+    Route = apps.get_model('tickets', 'Route')
+    RouteToArrivalPoint = apps.get_model('tickets', 'RouteToArrivalPoint')
+
+    stops = {}
+    for stop in RouteToArrivalPoint.objects.order_by('route', 'order').iterator():
+        stops.setdefault(stop.route_id, []).append(stop)
+    seats = dict(Carriage.objects.order_by().values('route').annotate(seats=Sum(F('seat_amount') - F('taken_seats')))
+                 .values_list('route', 'seats'))
+
+    entries = []
+    for route in Route.objects.iterator():
+        if not (route_stops := stops.get(route.id)):
+            continue
+        calls = [(0, route.departure_city_id, None, route.departure_time)]
+        calls += [(stop.order, stop.arrival_point_id, stop.arrival_time, stop.arrival_time) for stop in route_stops]
+        for (order, point, arrival_time, departure_time), next_call in zip(calls, calls[1:] + [None]):
+            entries.append(BoardEntry(
+                route_id=route.id,
+                point_id=point,
+                stop_order=order,
+                arrival_time=arrival_time,
+                departure_time=departure_time if next_call else None,
+                next_point_id=next_call[1] if next_call else None,
+                origin_id=route.departure_city_id,
+                destination_id=calls[-1][1],
+                available_seats=seats.get(route.id, 0),
+            ))
+    BoardEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0010_carriage_taken_seats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stop_order', models.IntegerField()),
+                ('arrival_time', models.DateTimeField(null=True)),
+                ('departure_time', models.DateTimeField(null=True)),
+                ('available_seats', models.IntegerField(default=0)),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tickets.arrivalpoint')),
+                ('next_point', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tickets.arrivalpoint')),
+                ('origin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tickets.arrivalpoint')),
+                ('point', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tickets.arrivalpoint')),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='board_entries', to='tickets.route')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='boardentry',
+            index=models.Index(fields=['point', 'departure_time'], name='board_point_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='boardentry',
+            index=models.Index(fields=['point', 'arrival_time'], name='board_point_arrival_idx'),
+        ),
+        migrations.RunPython(build_board_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_occupied_seats(apps, schema_editor):
+    Carriage = apps.get_model('tickets', 'Carriage')
+    CarriageSeat = apps.get_model('tickets', 'CarriageSeat')
+
+    seats = CarriageSeat.objects.filter(carriage=OuterRef('pk')).exclude(occupied_segments=0).order_by().values(
+        'carriage',
+    ).annotate(count=Count('seat_number'))
+    Carriage.objects.update(taken_seats=Coalesce(Subquery(seats.values('count')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0011_boardentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(count_occupied_seats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+
+
+def count_available_seats(apps, schema_editor):
+    BoardEntry = apps.get_model('tickets', 'BoardEntry')
+    Carriage = apps.get_model('tickets', 'Carriage')
+
+    seats = Carriage.objects.filter(route=OuterRef('route')).order_by().values('route').annotate(
+        seats=Sum(Greatest(F('seat_amount') - F('taken_seats'), 0)),
+    )
+    BoardEntry.objects.update(available_seats=Coalesce(Subquery(seats.values('seats')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0012_recount_taken_seats'),
+    ]
+
+    operations = [
+        migrations.RunPython(count_available_seats, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,39 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+from tickets.timewindows import validate_timezone
+
+
+class TicketQuerySet(models.QuerySet):
+    def with_details(self, lightweight=False):
+        """
+        Load everything ticket serializers render in a fixed number of queries.
+
+        Points, carriage and route come through joins and the arrival time at the arrival point is annotated.
+        Unless ``lightweight`` is set, the route stops are prefetched for the embedded route as well.
+        """
+        arrival_stop = RouteToArrivalPoint.objects.filter(route=models.OuterRef('carriage__route'),
+                                                          arrival_point=models.OuterRef('arrival_point'))
+        tickets = self.select_related(
+            'departure_point__arrival_city', 'arrival_point__arrival_city', 'carriage__route__departure_city__arrival_city',
+        ).annotate(arrival_time=models.Subquery(arrival_stop.values('arrival_time')[:1]))
+        if lightweight:
+            return tickets
+        stops = RouteToArrivalPoint.objects.select_related('arrival_point__arrival_city').order_by('order')
+        return tickets.prefetch_related(models.Prefetch('carriage__route__routetoarrivalpoint_set', queryset=stops))
+
+    def expired_holds(self):
+        """Tickets of pending orders whose seat hold has expired."""
+        return self.filter(order__order_status='pending', order__expires_at__lte=timezone.now())
+
+    def delete(self):
+        from tickets.inventory import count_taken_seats, release_seats
+
+        with transaction.atomic():
+            release_seats(self)
+            count_taken_seats(self, -1)
+            return super().delete()
 
 
 class Ticket(models.Model):
@@ -8,10 +43,21 @@ class Ticket(models.Model):
     carriage = models.ForeignKey('tickets.Carriage', on_delete=models.CASCADE, related_name='tickets')
     departure_point = models.ForeignKey('tickets.ArrivalPoint', on_delete=models.CASCADE)
     arrival_point = models.ForeignKey('tickets.ArrivalPoint', on_delete=models.CASCADE, related_name="tickets")
+    segment_mask = models.BigIntegerField(default=0)
+
+    objects = TicketQuerySet.as_manager()
 
     def __str__(self):
         return f'{self.carriage}, Seat: {self.seat_number}'
 
+    def delete(self, using=None, keep_parents=False):
+        from tickets.inventory import count_taken_seats, release_seats
+
+        with transaction.atomic():
+            release_seats([self])
+            count_taken_seats([self], -1)
+            return super().delete(using, keep_parents)
+
 
 class ArrivalPoint(models.Model):
     arrival_city = models.ForeignKey('tickets.City', on_delete=models.CASCADE, related_name='arrivals')
@@ -21,9 +67,28 @@ class ArrivalPoint(models.Model):
         return str(self.id)
 
 
+class RouteQuerySet(models.QuerySet):
+    def with_stops(self):
+        """Load departure points and ordered stops the way ``RouteSerializer`` renders them."""
+        stops = RouteToArrivalPoint.objects.select_related('arrival_point__arrival_city').order_by('order')
+        return self.select_related('departure_city__arrival_city').prefetch_related(
+            models.Prefetch('routetoarrivalpoint_set', queryset=stops)
+        )
+
+
 class Route(models.Model):
     departure_city = models.ForeignKey('tickets.ArrivalPoint', on_delete=models.CASCADE, related_name='departures')
     departure_time = models.DateTimeField(blank=False, null=False)
+    # Trip id of the timetable file the route was imported from
+    external_id = models.CharField(max_length=64, unique=True, null=True, blank=True)
+
+    objects = RouteQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Date range filters and the cursor ordering of the route list
+            models.Index(fields=['departure_time', 'id'], name='route_departure_time_idx'),
+        ]
 
     def __str__(self):
         return f'From {self.departure_city} at {self.departure_time}'
@@ -36,6 +101,12 @@ class RouteToArrivalPoint(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     arrival_time = models.DateTimeField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['route', 'order'], name='routestop_route_order_idx'),
+            models.Index(fields=['route', 'arrival_point'], name='routestop_route_point_idx'),
+        ]
+
 
 class CarriageType(models.Model):
     CARRIAGE_CHOICES = (
@@ -51,10 +122,43 @@ class Carriage(models.Model):
     carriage_type = models.ForeignKey('tickets.CarriageType', on_delete=models.CASCADE)
     seat_amount = models.IntegerField()
     route = models.ForeignKey('tickets.Route', on_delete=models.CASCADE, related_name='carriages')
+    # Seats of the carriage with any segment taken, kept up to date by ``tickets.inventory.count_taken_seats``
+    taken_seats = models.IntegerField(default=0, editable=False)
 
     def __str__(self):
         return f'{self.carriage_type}: {self.id}'
 
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        # The counter is only changed by ``F()`` updates, saving an instance would write back the value it was loaded with
+        if not self._state.adding and not force_insert and update_fields is None:
+            update_fields = [field.name for field in self._meta.concrete_fields
+                             if not field.primary_key and field.name != 'taken_seats']
+        return super().save(force_insert, force_update, using, update_fields)
+
+
+class CarriageSeat(models.Model):
+    carriage = models.ForeignKey('tickets.Carriage', on_delete=models.CASCADE, related_name='seats')
+    seat_number = models.IntegerField()
+    occupied_segments = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['carriage', 'seat_number'], name='unique_carriage_seat'),
+        ]
+
+    def __str__(self):
+        return f'{self.carriage}, Seat: {self.seat_number}'
+
+
+class OrderQuerySet(models.QuerySet):
+    def with_tickets(self):
+        """Prefetch ordered tickets with everything ``NestedOrderTicketSerializer`` renders."""
+        return self.prefetch_related(models.Prefetch('ordered_tickets', queryset=Ticket.objects.with_details(lightweight=True)))
+
+    def expired(self):
+        """Pending orders whose seat hold has expired."""
+        return self.filter(order_status='pending', expires_at__lte=timezone.now())
+
 
 class Order(models.Model):
     STATUS_CHOICES = (
@@ -65,11 +169,74 @@ class Order(models.Model):
     order_status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='orders')
+    expires_at = models.DateTimeField(null=True, blank=True)
+    # Last payment intent created for the order, reused while the amount (in cents) stays the same
+    payment_intent_id = models.CharField(max_length=255, null=True, blank=True)
+    payment_client_secret = models.CharField(max_length=255, null=True, blank=True)
+    payment_amount = models.PositiveIntegerField(null=True, blank=True)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'order_status'], name='order_user_status_idx'),
+            # Pending orders are a small, hot subset: the open order of a user and the expired holds
+            models.Index(fields=['user'], condition=models.Q(order_status='pending'), name='order_pending_user_idx'),
+            models.Index(fields=['expires_at'], condition=models.Q(order_status='pending'), name='order_pending_expiry_idx'),
+        ]
+
+    @property
+    def is_expired(self):
+        return self.order_status == 'pending' and self.expires_at is not None and self.expires_at <= timezone.now()
 
 
 class City(models.Model):
     city_name = models.CharField(max_length=32, unique=True)
     description = models.TextField(max_length=255, null=True, blank=True)
+    timezone = models.CharField(max_length=64, default=settings.TIME_ZONE, validators=[validate_timezone])
 
     def __str__(self):
         return self.city_name
+
+
+class RouteLeg(models.Model):
+    route = models.ForeignKey('tickets.Route', on_delete=models.CASCADE, related_name='legs')
+    departure_point = models.ForeignKey('tickets.ArrivalPoint', on_delete=models.CASCADE, related_name='+')
+    arrival_point = models.ForeignKey('tickets.ArrivalPoint', on_delete=models.CASCADE, related_name='+')
+    departure_order = models.IntegerField()
+    arrival_order = models.IntegerField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    departure_time = models.DateTimeField()
+    arrival_time = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['departure_point', 'arrival_point', 'departure_time'], name='routeleg_points_time_idx'),
+            models.Index(fields=['route', 'departure_point', 'arrival_point'], name='routeleg_route_points_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.route_id}: {self.departure_point_id} -> {self.arrival_point_id}'
+
+
+class BoardEntry(models.Model):
+    """A stop of a route on the departures and arrivals boards of its point, maintained by ``tickets.boards``."""
+    point = models.ForeignKey('tickets.ArrivalPoint', on_delete=models.CASCADE, related_name='+')
+    route = models.ForeignKey('tickets.Route', on_delete=models.CASCADE, related_name='board_entries')
+    stop_order = models.IntegerField()
+    # No arrival at the departure city of the route and no departure from its last stop
+    arrival_time = models.DateTimeField(null=True)
+    departure_time = models.DateTimeField(null=True)
+    next_point = models.ForeignKey('tickets.ArrivalPoint', on_delete=models.CASCADE, related_name='+', null=True)
+    origin = models.ForeignKey('tickets.ArrivalPoint', on_delete=models.CASCADE, related_name='+')
+    destination = models.ForeignKey('tickets.ArrivalPoint', on_delete=models.CASCADE, related_name='+')
+    available_seats = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['point', 'departure_time'], name='board_point_departure_idx'),
+            models.Index(fields=['point', 'arrival_time'], name='board_point_arrival_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.route_id}: stop {self.stop_order} at {self.point_id}'
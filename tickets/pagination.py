@@ -0,0 +1,37 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class RailwayCursorPagination(CursorPagination):
+    """
+    Keyset pagination for list endpoints.
+
+    Pages are fetched with ``WHERE <ordering> > <cursor> LIMIT n`` on indexed columns,
+    so the cost of a page does not depend on the table size. Views choose the ordering
+    through the ``pagination_ordering`` attribute, the default being the primary key.
+    """
+    ordering = ('id', )
+    page_size_query_param = 'page_size'
+    max_page_size = settings.MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'pagination_ordering', self.ordering)
+        return (ordering, ) if isinstance(ordering, str) else tuple(ordering)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'data': data,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'data': schema,
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+            },
+        }
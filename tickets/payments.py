@@ -0,0 +1,129 @@
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from functools import lru_cache
+
+import stripe
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from tickets.models import Order
+
+
+class PaymentError(Exception):
+    """The payment provider failed or could not be reached."""
+
+
+class PaymentPending(Exception):
+    """The payment intent is still being created in the background."""
+
+
+class PaymentGateway(ABC):
+    @abstractmethod
+    def create_intent(self, amount, currency, idempotency_key, metadata=None):
+        """
+        Create a payment intent, or return the one already created with the same idempotency key.
+
+        :param amount: amount in the smallest currency unit
+        :return: dict with the intent ``id`` and ``client_secret``
+        """
+
+
+class StripeGateway(PaymentGateway):
+
+    def __init__(self):
+        # Keeps a session, hence open connections to the API, per thread instead of connecting for every call
+        stripe.default_http_client = stripe.http_client.RequestsClient()
+
+    def create_intent(self, amount, currency, idempotency_key, metadata=None):
+        try:
+            intent = stripe.PaymentIntent.create(
+                amount=amount,
+                currency=currency,
+                payment_method_types=['card'],
+                metadata=metadata or {},
+                idempotency_key=idempotency_key,
+            )
+        except stripe.error.StripeError as error:
+            raise PaymentError(str(error)) from error
+        return {'id': intent['id'], 'client_secret': intent['client_secret']}
+
+
+class FakeGateway(PaymentGateway):
+    """Local gateway for development and tests, honours idempotency keys like the real one."""
+
+    def __init__(self):
+        self.intents = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create_intent(self, amount, currency, idempotency_key, metadata=None):
+        with self._lock:
+            self.calls += 1
+            if idempotency_key not in self.intents:
+                intent_id = f'pi_fake_{hashlib.md5(idempotency_key.encode()).hexdigest()[:24]}'
+                self.intents[idempotency_key] = {'id': intent_id, 'client_secret': f'{intent_id}_secret'}
+            return self.intents[idempotency_key]
+
+
+@lru_cache(maxsize=None)
+def get_gateway():
+    return import_string(settings.PAYMENT_GATEWAY)()
+
+
+_executor = ThreadPoolExecutor(max_workers=settings.PAYMENT_WORKERS, thread_name_prefix='payments')
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def _idempotency_key(order, amount):
+    # A different amount (more tickets, a discount) needs a new intent, the provider rejects reused keys otherwise
+    return f'order-{order.id}-{amount}'
+
+
+def _create_intent(order_id, amount, idempotency_key):
+    intent = get_gateway().create_intent(amount, settings.PAYMENT_CURRENCY, idempotency_key, {'order_id': order_id})
+    Order.objects.filter(pk=order_id).update(
+        payment_intent_id=intent['id'], payment_client_secret=intent['client_secret'], payment_amount=amount,
+    )
+    return intent
+
+
+def _create_intent_in_pool(order_id, amount, idempotency_key):
+    try:
+        return _create_intent(order_id, amount, idempotency_key)
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(idempotency_key, None)
+        connection.close()
+
+
+def order_client_secret(order, price):
+    """
+    Return the client secret of the payment intent for ``price`` of an order.
+
+    The intent is stored on the order, so repeated calls for the same amount do not reach the provider. With
+    ``PAYMENT_TIMEOUT`` set the intent is created by a worker pool and the caller waits at most that long.
+
+    :param order: order being paid
+    :param price: decimal amount to charge
+    :raise PaymentPending: the intent was not created within ``PAYMENT_TIMEOUT``, it will be stored once it is
+    :raise PaymentError: the provider failed
+    """
+    amount = int(price * 100)
+    if order.payment_client_secret and order.payment_amount == amount:
+        return order.payment_client_secret
+
+    idempotency_key = _idempotency_key(order, amount)
+    if settings.PAYMENT_TIMEOUT is None:
+        return _create_intent(order.id, amount, idempotency_key)['client_secret']
+
+    with _in_flight_lock:
+        if (future := _in_flight.get(idempotency_key)) is None:
+            future = _in_flight[idempotency_key] = _executor.submit(_create_intent_in_pool, order.id, amount, idempotency_key)
+    try:
+        return future.result(timeout=settings.PAYMENT_TIMEOUT)['client_secret']
+    except TimeoutError:
+        raise PaymentPending()
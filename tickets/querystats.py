@@ -0,0 +1,153 @@
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('railway.queries')
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """An endpoint ran more SQL queries than its view declares in ``query_action_budgets``."""
+
+
+class _QueryRecorder:
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_duration = 0.0
+        self.slowest_sql = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            if duration >= self.slowest_duration:
+                self.slowest_duration, self.slowest_sql = duration, sql
+
+
+@contextmanager
+def _recording(recorder):
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield
+
+
+def _endpoint(request, view_func):
+    """
+    Name the endpoint a view function serves, ``ViewSet.action`` for viewsets, and its query budget if any.
+    """
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return request.resolver_match.view_name, None
+
+    method = request.method.lower()
+    action = (getattr(view_func, 'actions', None) or {}).get(method, method)
+    return f'{view_class.__name__}.{action}', getattr(view_class, 'query_action_budgets', {}).get(action)
+
+
+def _record(endpoint, recorder):
+    with _stats_lock:
+        stats = _stats.setdefault(endpoint, {
+            'requests': 0, 'queries': 0, 'max_queries': 0, 'db_time_ms': 0.0, 'slowest_ms': 0.0, 'slowest_sql': None,
+        })
+        stats['requests'] += 1
+        stats['queries'] += recorder.count
+        stats['max_queries'] = max(stats['max_queries'], recorder.count)
+        stats['db_time_ms'] += recorder.duration * 1000
+        if recorder.slowest_duration * 1000 >= stats['slowest_ms']:
+            stats['slowest_ms'], stats['slowest_sql'] = recorder.slowest_duration * 1000, recorder.slowest_sql
+
+
+def query_metrics():
+    """
+    Return the SQL statistics this process sampled so far per endpoint.
+
+    :return: dict of endpoint name to requests, average and maximum query count, DB time and the slowest statement
+    """
+    with _stats_lock:
+        return {
+            endpoint: {
+                'requests': stats['requests'],
+                'avg_queries': round(stats['queries'] / stats['requests'], 2),
+                'max_queries': stats['max_queries'],
+                'avg_db_time_ms': round(stats['db_time_ms'] / stats['requests'], 3),
+                'slowest_ms': round(stats['slowest_ms'], 3),
+                'slowest_sql': stats['slowest_sql'],
+            }
+            for endpoint, stats in sorted(_stats.items())
+        }
+
+
+class QueryStatsMiddleware:
+    """
+    Measure the SQL queries of a sample of requests per endpoint.
+
+    ``QUERY_STATS_SAMPLE_RATE`` of the requests are measured. Each one is logged as a JSON line to the
+    ``railway.queries`` logger and added to ``query_metrics``. Views declare the most queries an action may run
+    in ``query_action_budgets``. Going over it logs a warning, or raises ``QueryBudgetExceeded`` with
+    ``QUERY_BUDGET_STRICT`` set, which also measures every request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not (settings.QUERY_BUDGET_STRICT or random.random() < settings.QUERY_STATS_SAMPLE_RATE):
+            return self.get_response(request)
+
+        recorder = _QueryRecorder()
+        with _recording(recorder):
+            response = self.get_response(request)
+
+        if (endpoint := getattr(request, '_query_stats_endpoint', None)) is None:
+            return response
+        if response.streaming:
+            # The body and the queries reading it are produced while the server iterates over the response
+            response.streaming_content = self._streamed(response.streaming_content, recorder, request, response, endpoint)
+            return response
+        self._finish(recorder, request, response, endpoint)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_stats_endpoint = _endpoint(request, view_func)
+
+    def _streamed(self, content, recorder, request, response, endpoint):
+        with _recording(recorder):
+            yield from content
+        self._finish(recorder, request, response, endpoint)
+
+    def _finish(self, recorder, request, response, endpoint):
+        name, budget = endpoint
+        _record(name, recorder)
+        line = {
+            'endpoint': name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_time_ms': round(recorder.duration * 1000, 3),
+            'slowest_ms': round(recorder.slowest_duration * 1000, 3),
+            'slowest_sql': recorder.slowest_sql,
+            'budget': budget,
+        }
+        if budget is None or recorder.count <= budget:
+            logger.info(json.dumps(line))
+            return
+
+        logger.warning(json.dumps(line))
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(f'{name} ran {recorder.count} SQL queries, its budget is {budget}')
@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import serializers
+
+from tickets.cache import invalidate_responses
+from tickets.inventory import claim_seats, count_taken_seats, seats_filter
+from tickets.models import CarriageSeat, Order, Ticket
+from users.models import User
+
+
+def release_orders(orders):
+    """
+    Fail pending orders and give their seats back.
+
+    Orders locked by another transaction (e.g. their owner is adding a ticket right now) are skipped and picked up
+    by a later call, and so are orders with seats locked by another transaction. Bookings lock seats before their
+    order, so waiting for a seat while holding its order could deadlock with them. Tickets of the released orders
+    are deleted, which clears their segments in the seat bitmaps.
+
+    :param orders: queryset of pending orders to release
+    :return: number of released orders
+    """
+    with transaction.atomic():
+        order_ids = list(orders.filter(order_status='pending').select_for_update(skip_locked=True).values_list('id', flat=True))
+        if seats := list(Ticket.objects.filter(order__in=order_ids).values_list('order_id', 'carriage_id', 'seat_number')):
+            locked_seats = set(CarriageSeat.objects.filter(seats_filter([seat[1:] for seat in seats]))
+                               .select_for_update(skip_locked=True).values_list('carriage_id', 'seat_number'))
+            busy_orders = {order_id for order_id, *seat in seats if tuple(seat) not in locked_seats}
+            order_ids = [order_id for order_id in order_ids if order_id not in busy_orders]
+        if order_ids:
+            Ticket.objects.filter(order__in=order_ids).delete()
+            Order.objects.filter(id__in=order_ids).update(order_status='fail', expires_at=None)
+            invalidate_responses(Order)
+        return len(order_ids)
+
+
+def _claim_seats(seats, mask):
+    """Claim seats, releasing expired holds that block them before giving up."""
+    savepoint = transaction.savepoint()
+    if claim_seats(seats, mask):
+        transaction.savepoint_commit(savepoint)
+        return True
+
+    transaction.savepoint_rollback(savepoint)
+    blocking_orders = Ticket.objects.filter(seats_filter(seats)).expired_holds().values('order')
+    return bool(release_orders(Order.objects.expired().filter(id__in=blocking_orders))) and claim_seats(seats, mask)
+
+
+def _lock_pending_order(user):
+    """
+    Return the live pending order of a user locked for update, creating it if needed.
+
+    Only the order row is locked. The user row is locked just while a new pending order is created, so two first
+    bookings of the same user cannot end up in two different orders. An expired pending order is released first.
+    """
+    if order := Order.objects.select_for_update().filter(order_status='pending', user=user).first():
+        if not order.is_expired:
+            return order
+        release_orders(Order.objects.filter(pk=order.pk))
+
+    User.objects.select_for_update().filter(pk=user.pk).exists()
+    if order := Order.objects.select_for_update().filter(order_status='pending', user=user).first():
+        return order
+    return Order.objects.create(user=user, order_status='pending', total_price=0)
+
+
+def reserve_tickets(user, tickets_data):
+    """
+    Claim seats and add tickets for them to the pending order of a user.
+
+    Seats are claimed with one conditional bitmap update per leg before anything else, so concurrent buyers of the
+    same seat and leg are serialized on that seat row only. Either every ticket is created or none. The order total
+    is incremented in the database with an ``F()`` expression instead of being rewritten from Python, and the hold
+    of the order is extended by ``SEAT_HOLD_TTL``. The claimed seats are added to the counters of their carriages.
+
+    :param user: buyer
+    :param tickets_data: validated ``TicketSerializer`` data of each ticket
+    :return: created tickets
+    """
+    seats_by_mask = {}
+    for ticket_data in tickets_data:
+        seats_by_mask.setdefault(ticket_data['segment_mask'], []).append((ticket_data['carriage'].id, ticket_data['seat_number']))
+
+    with transaction.atomic():
+        for mask, seats in seats_by_mask.items():
+            if not _claim_seats(seats, mask):
+                raise serializers.ValidationError({'seat_number': 'This seat is not available'})
+
+        order = _lock_pending_order(user)
+        Order.objects.filter(pk=order.pk).update(
+            total_price=F('total_price') + sum(data['price'] for data in tickets_data),
+            expires_at=timezone.now() + settings.SEAT_HOLD_TTL,
+        )
+        invalidate_responses(Ticket, Order)
+        tickets = Ticket.objects.bulk_create(Ticket(order=order, **ticket_data) for ticket_data in tickets_data)
+        # Last, the carriage rows stay locked for the rest of the transaction
+        count_taken_seats(tickets)
+        return tickets
@@ -0,0 +1,81 @@
+import threading
+from functools import partial
+
+from django.db import transaction
+
+from tickets.boards import build_board_entries, replace_board_entries
+from tickets.models import Route, RouteLeg, RouteToArrivalPoint
+from tickets.timetable import record_route_changes
+
+_pending = threading.local()
+
+
+def build_route_legs(route, stops):
+    """
+    Build every (origin, destination) leg of a route.
+
+    The departure city is the stop with order 0, so a route with ``n`` stops produces ``n * (n + 1) / 2`` legs.
+
+    :param route: route instance
+    :param stops: route stops ordered by ``order``
+    :return: list of unsaved ``RouteLeg`` instances
+    """
+    boarding_points = [(0, route.departure_city_id, route.departure_time, 0)]
+    boarding_points += [(stop.order, stop.arrival_point_id, stop.arrival_time, stop.price) for stop in stops]
+    legs = []
+    for index, (departure_order, departure_point, departure_time, departure_price) in enumerate(boarding_points):
+        for arrival_order, arrival_point, arrival_time, arrival_price in boarding_points[index + 1:]:
+            legs.append(RouteLeg(
+                route=route,
+                departure_point_id=departure_point,
+                arrival_point_id=arrival_point,
+                departure_order=departure_order,
+                arrival_order=arrival_order,
+                price=arrival_price - departure_price,
+                departure_time=departure_time,
+                arrival_time=arrival_time,
+            ))
+    return legs
+
+
+def rebuild_route_legs(route_ids):
+    """
+    Replace the legs and board entries of the given routes with ones built from their current stops.
+
+    The journey planner timetables reload the same routes once the new legs are committed.
+    """
+    route_ids = set(route_ids)
+    routes = Route.objects.filter(id__in=route_ids)
+    stops = {}
+    for stop in RouteToArrivalPoint.objects.filter(route__in=route_ids).order_by('route', 'order'):
+        stops.setdefault(stop.route_id, []).append(stop)
+
+    legs, board_entries = [], []
+    for route in routes:
+        legs += build_route_legs(route, stops.get(route.id, []))
+        board_entries += build_board_entries(route, stops.get(route.id, []))
+
+    with transaction.atomic():
+        RouteLeg.objects.filter(route__in=route_ids).delete()
+        RouteLeg.objects.bulk_create(legs, batch_size=1000)
+        replace_board_entries(route_ids, board_entries)
+        transaction.on_commit(partial(record_route_changes, route_ids))
+
+
+def _flush_pending_routes():
+    route_ids = getattr(_pending, 'route_ids', set())
+    _pending.route_ids = set()
+    if route_ids:
+        rebuild_route_legs(route_ids)
+
+
+def schedule_route_legs_rebuild(route_id):
+    """
+    Rebuild the legs of a route once the current transaction commits.
+
+    Several changes of the same route inside one transaction cause a single rebuild.
+    """
+    if not hasattr(_pending, 'route_ids'):
+        _pending.route_ids = set()
+    _pending.route_ids.add(route_id)
+    transaction.on_commit(_flush_pending_routes)
@@ -0,0 +1,46 @@
+from django.conf import settings
+
+from tickets.models import City, Route, RouteLeg
+from tickets.timewindows import day_window, local_today
+
+
+def search_routes(departure_point, arrival_point=None, departure_day=None):
+    """
+    Find routes passing through ``departure_point`` (and later ``arrival_point``) with a single query.
+
+    A route matches when the passenger can board at the departure point, i.e. the point is the route departure city
+    or any stop but the last one. Every such boarding has at least one leg in the ``RouteLeg`` index, so the search
+    is an indexed lookup on (departure point, arrival point, departure time).
+
+    :param departure_point: id of the boarding arrival point
+    :param arrival_point: optional id of the point that has to be reached after boarding
+    :param departure_day: optional date, in the departure point time zone, the train has to be at the departure point
+    :return: queryset of matching routes ordered by departure time
+    """
+    station_tz = _station_timezone(departure_point).first() or settings.TIME_ZONE
+    return _matching_routes(station_tz, departure_point, arrival_point, departure_day)
+
+
+async def asearch_routes(departure_point, arrival_point=None, departure_day=None):
+    """Async ``search_routes``, the returned queryset is not evaluated yet."""
+    station_tz = await _station_timezone(departure_point).afirst() or settings.TIME_ZONE
+    return _matching_routes(station_tz, departure_point, arrival_point, departure_day)
+
+
+def _station_timezone(point):
+    return City.objects.filter(arrivals=point).values_list('timezone', flat=True)
+
+
+def _matching_routes(station_tz, departure_point, arrival_point, departure_day):
+    legs = RouteLeg.objects.filter(departure_point=departure_point)
+
+    if arrival_point:
+        legs = legs.filter(arrival_point=arrival_point)
+
+    if departure_day:
+        day_start, day_end = day_window(departure_day, station_tz)
+        legs = legs.filter(departure_time__gte=day_start, departure_time__lt=day_end)
+
+    today_start, _ = day_window(local_today(station_tz), station_tz)
+    routes = Route.objects.filter(id__in=legs.values('route'), departure_time__gte=today_start)
+    return routes.order_by('departure_time', 'id')
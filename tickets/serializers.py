@@ -1,19 +1,29 @@
 from datetime import datetime
 
+from django.db import models, transaction
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer, Serializer
-from django.db.models import Q
-from tickets.models import Ticket, Route, ArrivalPoint, Order, City, Carriage, CarriageType, RouteToArrivalPoint
+from tickets.models import Ticket, Route, ArrivalPoint, Order, City, Carriage, CarriageType, RouteToArrivalPoint, RouteLeg
+from tickets.availability import route_availability
+from tickets.boards import BOARD_POINTS
+from tickets.cache import invalidate_responses
+from tickets.inventory import MAX_ROUTE_SEGMENTS, segment_mask, taken_seats, free_seats
+from tickets.journeys import MAX_JOURNEY_TRANSFERS, plan_journeys
+from tickets.reservations import reserve_tickets, release_orders
+from tickets.search import search_routes
+from tickets.timetable import get_timetable
 from users.models import Discount
 
 DATETIME_FORMAT = "%Y-%m-%d %H:%M"
+MAX_BATCH_TICKETS = 40
 
 
 class CitySerializer(ModelSerializer):
 
     class Meta:
         model = City
-        fields = ('id', 'city_name', 'description')
+        fields = ('id', 'city_name', 'description', 'timezone')
 
 
 class ArrivalPointSerializer(ModelSerializer):
@@ -40,96 +50,127 @@ class CarriageTypeSerializer(ModelSerializer):
 
 
 class NestedArrivalPointSerializer(Serializer):
-    arrival_point = serializers.CharField(max_length=32)
+    # Resolved by ``RouteSerializer.validate`` together with the other points of the route
+    arrival_point = serializers.IntegerField(source='arrival_point_id')
     price = serializers.DecimalField(max_digits=10, decimal_places=2, required=True)
     arrival_time = serializers.DateTimeField(format=DATETIME_FORMAT, required=True)
     order = serializers.IntegerField(required=False, write_only=True)
 
-    def validate_arrival_point_id(self, data):
-        if ArrivalPoint.objects.filter(id=data):
-            raise serializers.ValidationError('No arrival point with this id')
-        return data
-
-    def to_internal_value(self, data):
-        super().to_internal_value(data)
-        data['arrival_point'] = ArrivalPoint.objects.get(id=data['arrival_point'])
-        return data
-
     def to_representation(self, instance):
         data = super().to_representation(instance=instance)
-        arrival_point_id = data['arrival_point']
         del data['arrival_point']
-        data.update(ArrivalPointSerializer(instance=ArrivalPoint.objects.get(id=arrival_point_id)).data)
+        data.update(ArrivalPointSerializer(instance=instance.arrival_point).data)
         return data
 
 
+class RouteListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        routes = list(data.all() if isinstance(data, models.Manager) else data)
+        if 'route_availability' not in self.context:
+            self._context['route_availability'] = route_availability([route.id for route in routes])
+        return super().to_representation(routes)
+
+
 class RouteSerializer(ModelSerializer):
-    departure_city = serializers.CharField(max_length=32)
+    departure_city = serializers.IntegerField(source='departure_city_id')
     departure_time = serializers.DateTimeField(format=DATETIME_FORMAT)
     arrival_points = NestedArrivalPointSerializer(many=True, write_only=True)
 
     class Meta:
         model = Route
         fields = ('id', 'departure_city', 'departure_time', 'arrival_points')
-
-    def to_internal_value(self, data):
-        super().to_internal_value(data)
-        if departure_city := data.get('departure_city'):
-            try:
-                data['departure_city'] = ArrivalPoint.objects.get(id=departure_city)
-            except City.DoesNotExist:
+        list_serializer_class = RouteListSerializer
+
+    def validate(self, data):
+        """
+        Check the stops in one pass over the parsed fields and resolve every point of the route with one query.
+
+        :param data: fields parsed by ``to_internal_value``
+        :return: data with ``ArrivalPoint`` instances instead of point ids
+        """
+        points = data.get('arrival_points', [])
+        if len(points) > MAX_ROUTE_SEGMENTS:
+            raise serializers.ValidationError({'arrival_points': f'A route can have at most {MAX_ROUTE_SEGMENTS} arrival points'})
+
+        point_ids = {point['arrival_point_id'] for point in points}
+        if 'departure_city_id' in data:
+            point_ids.add(data['departure_city_id'])
+        found = ArrivalPoint.objects.select_related('arrival_city').in_bulk(point_ids)
+        if 'departure_city_id' in data:
+            if data['departure_city_id'] not in found:
                 raise serializers.ValidationError({'departure_city': 'City does not exist'})
-        points = data['arrival_points']
-
-        if not points:
-            return data
-        if not all(points[i]['price'] <= points[i+1]['price'] and
-                   datetime.fromisoformat(points[i]['arrival_time']) <= datetime.fromisoformat(points[i+1]['arrival_time']) for i in range(len(points) - 1)):
-            raise serializers.ValidationError({'arrival_points': 'The order of arrival points is invalid, check time and price'})
-
-        if datetime.strptime(points[0]['arrival_time'], DATETIME_FORMAT) <= datetime.strptime(data['departure_time'], DATETIME_FORMAT):
-            raise serializers.ValidationError({'arrival_points': 'First arrival time is before the departure time'})
+            data['departure_city'] = found[data.pop('departure_city_id')]
+        if missing := sorted(point_ids - found.keys()):
+            raise serializers.ValidationError({'arrival_points': f'No arrival points with ids {", ".join(map(str, missing))}'})
+
+        previous_time, previous_price = data.get('departure_time'), None
+        for index, point in enumerate(points):
+            point['arrival_point'] = found[point.pop('arrival_point_id')]
+            if index == 0 and previous_time is not None and point['arrival_time'] <= previous_time:
+                raise serializers.ValidationError({'arrival_points': 'First arrival time is before the departure time'})
+            if index > 0 and (point['arrival_time'] < previous_time or point['price'] < previous_price):
+                raise serializers.ValidationError({'arrival_points': 'The order of arrival points is invalid, check time and price'})
+            previous_time, previous_price = point['arrival_time'], point['price']
 
         return data
 
     def to_representation(self, instance):
         data = super().to_representation(instance=instance)
-        arrival_points = RouteToArrivalPoint.objects.filter(route=data['id'])
-        nested_data = NestedArrivalPointSerializer(arrival_points, many=True).data
-        data['arrival_points'] = nested_data
-        data['departure_city'] = ArrivalPointSerializer(instance=ArrivalPoint.objects.get(id=data['departure_city'])).data
-        carriages = list(instance.carriages.all())
-        data['carriages'] = {}
-        car_type_seats = {'available_seats_amount': 0,
-                          'price': arrival_points.order_by('-order').first().price}
-
-        for carriage in carriages:
-            tickets_carriage = Ticket.objects.filter(carriage=carriage)
-            taken_seats = [ticket.seat_number for ticket in tickets_carriage]
-            available_seats = carriage.seat_amount - len(taken_seats)
+        arrival_points = sorted(instance.routetoarrivalpoint_set.all(), key=lambda point: point.order)
+        data['arrival_points'] = NestedArrivalPointSerializer(arrival_points, many=True).data
+        data['departure_city'] = ArrivalPointSerializer(instance=instance.departure_city).data
 
-            car_type_seats['available_seats_amount'] += available_seats
+        availability = self.context.get('route_availability', {})
+        if instance.id not in availability:
+            availability = route_availability([instance.id])
+        available_seats_amount = sum(availability[instance.id].values())
 
-        if car_type_seats['available_seats_amount']:
-            data['carriages'] = car_type_seats
+        data['carriages'] = {}
+        if available_seats_amount > 0:
+            data['carriages'] = {'available_seats_amount': available_seats_amount,
+                                 'price': arrival_points[-1].price if arrival_points else None}
 
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         arrival_points = validated_data.pop('arrival_points')
         route = Route.objects.create(**validated_data)
-        for order, point in enumerate(arrival_points):
-            point['order'] = order + 1
-            RouteToArrivalPoint.objects.create(route=route, **point)
-
+        # The legs of the route are rebuilt from these stops when the route signal fires on commit
+        stops = RouteToArrivalPoint.objects.bulk_create(
+            RouteToArrivalPoint(route=route, **{**point, 'order': order}) for order, point in enumerate(arrival_points, start=1)
+        )
+        invalidate_responses(RouteToArrivalPoint)
+        # The response renders the stops just created, with the points resolved by ``validate``
+        route._prefetched_objects_cache = {'routetoarrivalpoint_set': stops}
         return route
 
 
+class RouteSummarySerializer(ModelSerializer):
+    departure_city = ArrivalPointSerializer()
+    departure_time = serializers.DateTimeField(format=DATETIME_FORMAT)
+
+    class Meta:
+        model = Route
+        fields = ('id', 'departure_city', 'departure_time')
+
+
+class CarriageListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        carriages = list(data.all() if isinstance(data, models.Manager) else data)
+        if not self.context.get('lightweight') and 'route_availability' not in self.context:
+            self._context['route_availability'] = route_availability({carriage.route_id for carriage in carriages})
+        return super().to_representation(carriages)
+
+
 class CarriageSerializer(ModelSerializer):
 
     class Meta:
         model = Carriage
         fields = ('id', 'carriage_type', 'seat_amount', 'route')
+        list_serializer_class = CarriageListSerializer
 
     def validate_seat_amount(self, data):
         if data > 100:
@@ -138,15 +179,30 @@ class CarriageSerializer(ModelSerializer):
 
     def to_representation(self, instance):
         data = super().to_representation(instance=instance)
-        data['route'] = RouteSerializer(instance.route).data
+        if self.context.get('lightweight'):
+            data['route'] = RouteSummarySerializer(instance.route).data
+        else:
+            data['route'] = RouteSerializer(instance.route, context=self.context).data
         return data
 
 
+class CarriageSeatsListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        carriages = list(data.all() if isinstance(data, models.Manager) else data)
+        if 'free_seats' not in self.context:
+            self._context['free_seats'] = free_seats([carriage.id for carriage in carriages], self.context.get('segment_mask', -1))
+        if 'route_availability' not in self.context:
+            self._context['route_availability'] = route_availability({carriage.route_id for carriage in carriages})
+        return super().to_representation(carriages)
+
+
 class CarriageSeatsSerializer(ModelSerializer):
 
     class Meta:
         model = Carriage
         fields = ('id', 'carriage_type', 'seat_amount', 'route')
+        list_serializer_class = CarriageSeatsListSerializer
 
     def validate_seat_amount(self, data):
         if data > 100:
@@ -155,79 +211,157 @@ class CarriageSeatsSerializer(ModelSerializer):
 
     def to_representation(self, instance):
         data = super().to_representation(instance=instance)
-        tickets_carriage = Ticket.objects.filter(carriage=instance)
-        taken_seats = [ticket.seat_number for ticket in tickets_carriage]
-        all_seats = range(1, instance.seat_amount + 1)
-
-        available_seats = list(set(all_seats) - set(taken_seats))
-        data['route'] = RouteSerializer(instance.route).data
-        data['available_seats'] = available_seats
+        seats = self.context.get('free_seats', {})
+        if instance.id not in seats:
+            seats = free_seats([instance.id], self.context.get('segment_mask', -1))
+        data['route'] = RouteSerializer(instance.route, context=self.context).data
+        data['available_seats'] = seats[instance.id]
         return data
 
 
+class CarriageLegParamsSerializer(Serializer):
+    """Optional leg of the route whose free seats the carriages list."""
+    departure_point = serializers.IntegerField(required=False)
+    arrival_point = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if ('departure_point' in attrs) != ('arrival_point' in attrs):
+            raise serializers.ValidationError('Provide both departure_point and arrival_point or neither')
+        return attrs
+
+
+def ticket_points_representation(ticket):
+    """
+    Departure and arrival points of a ticket with the times the train is there.
+
+    Uses the ``arrival_time`` annotation of ``Ticket.objects.with_details()`` when it is present.
+    """
+    if (arrival_time := getattr(ticket, 'arrival_time', None)) is None:
+        arrival_time = RouteToArrivalPoint.objects.filter(arrival_point_id=ticket.arrival_point_id,
+                                                          route_id=ticket.carriage.route_id).first().arrival_time
+    arrival_point = ArrivalPointSerializer(instance=ticket.arrival_point).data
+    departure_point = ArrivalPointSerializer(instance=ticket.departure_point).data
+    departure_point.update({'arrival_time': datetime.strftime(ticket.carriage.route.departure_time, DATETIME_FORMAT)})
+    arrival_point.update({'arrival_time': datetime.strftime(arrival_time, DATETIME_FORMAT)})
+    return {'arrival_point': arrival_point, 'departure_point': departure_point}
+
+
+class TicketListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        tickets = list(data.all() if isinstance(data, models.Manager) else data)
+        if not self.context.get('lightweight'):
+            self._context['route_availability'] = route_availability({ticket.carriage.route_id for ticket in tickets})
+        return super().to_representation(tickets)
+
+
 class TicketSerializer(ModelSerializer):
 
     class Meta:
         model = Ticket
         fields = ('id', 'departure_point', 'arrival_point', 'carriage', 'seat_number')
+        list_serializer_class = TicketListSerializer
 
     def to_internal_value(self, data):
         data = super().to_internal_value(data)
         if data.get('carriage').seat_amount < data.get('seat_number'):
             raise serializers.ValidationError({'seat_number': 'Seat number is not found in this carriage'})
 
-        if Ticket.objects.filter(arrival_point=data['arrival_point'], carriage=data['carriage'], seat_number=data['seat_number']):
+        if not (leg := RouteLeg.objects.filter(route=data['carriage'].route_id, departure_point=data['departure_point'],
+                                               arrival_point=data['arrival_point']).first()):
+            self._raise_invalid_leg(data)
+
+        data['segment_mask'] = segment_mask(leg.departure_order, leg.arrival_order)
+        if taken_seats([(data['carriage'].id, data['seat_number'])], data['segment_mask']):
             raise serializers.ValidationError({'seat_number': 'This seat is not available'})
 
-        if not (arrival_route_point := RouteToArrivalPoint.objects.filter(arrival_point=data['arrival_point'], route=data['carriage'].route).first()):
+        data['price'] = leg.price
+        return data
+
+    def _raise_invalid_leg(self, data):
+        route = data['carriage'].route
+        if not (arrival_route_point := RouteToArrivalPoint.objects.filter(arrival_point=data['arrival_point'], route=route).first()):
             raise serializers.ValidationError({'arrival_point': 'No such arrival point in the route'})
 
-        if not (departure_route_point := RouteToArrivalPoint.objects.filter(arrival_point=data['departure_point'], route=data['carriage'].route).first()):
-            departure_price = 0
-            if not data['carriage'].route.departure_city == data.get('departure_point'):
+        if not (departure_route_point := RouteToArrivalPoint.objects.filter(arrival_point=data['departure_point'], route=route).first()):
+            if not route.departure_city == data.get('departure_point'):
                 raise serializers.ValidationError({'departure_point': 'No such departure point in the route'})
-        else:
-            departure_price = departure_route_point.price
-            if departure_route_point.order >= arrival_route_point.order:
-                raise serializers.ValidationError({'arrival_point': 'Invalid order'})
-
-        data['price'] = arrival_route_point.price - departure_price
-        return data
+        elif departure_route_point.order >= arrival_route_point.order:
+            raise serializers.ValidationError({'arrival_point': 'Invalid order'})
+        raise serializers.ValidationError({'arrival_point': 'No such leg in the route'})
 
     def to_representation(self, instance):
         data = super().to_representation(instance=instance)
-        data['carriage'] = CarriageSerializer(instance.carriage).data
+        data['carriage'] = CarriageSerializer(instance.carriage, context=self.context).data
         data['price'] = instance.price
-        data['arrival_point'] = ArrivalPointSerializer(instance=instance.arrival_point).data
-        data['departure_point'] = ArrivalPointSerializer(instance=instance.departure_point).data
-        data['departure_point'].update({'arrival_time': datetime.strftime(instance.carriage.route.departure_time, DATETIME_FORMAT)})
-        data['arrival_point'].update({'arrival_time': datetime.strftime(RouteToArrivalPoint.objects.filter(arrival_point_id=instance.arrival_point, route_id=instance.carriage.route).first().arrival_time, DATETIME_FORMAT)})
-
+        data.update(ticket_points_representation(instance))
         return data
 
     def create(self, validated_data):
-        current_user = self.context['request'].user
-        if not (exist_order := Order.objects.filter(order_status="pending", user=current_user)):
-            order_info = {
-                "user": current_user,
-                "order_status": "pending",
-                "total_price": validated_data.get('price')
-            }
-            order = Order.objects.create(**order_info)
-        else:
-            order = exist_order.first()
-            order.total_price += validated_data.get('price')
-            order.save()
-        ticket = Ticket.objects.create(order=order, **validated_data)
+        return reserve_tickets(self.context['request'].user, [validated_data])[0]
+
 
-        return ticket
+class TicketSeatSerializer(Serializer):
+    carriage = serializers.IntegerField(required=True)
+    seat_number = serializers.IntegerField(required=True, min_value=1)
 
 
-class SearchRouteSerializer(Serializer):
+class TicketBatchSerializer(Serializer):
+    departure_point = serializers.IntegerField(required=True)
+    arrival_point = serializers.IntegerField(required=True)
+    seats = TicketSeatSerializer(many=True, allow_empty=False, max_length=MAX_BATCH_TICKETS)
+
+    def to_internal_value(self, data):
+        data = super().to_internal_value(data)
+        points = ArrivalPoint.objects.in_bulk([data['departure_point'], data['arrival_point']])
+        if data['departure_point'] not in points:
+            raise serializers.ValidationError({'departure_point': 'Arrival point does not exist'})
+        if data['arrival_point'] not in points:
+            raise serializers.ValidationError({'arrival_point': 'Arrival point does not exist'})
+
+        seats = [(seat['carriage'], seat['seat_number']) for seat in data['seats']]
+        if len(set(seats)) != len(seats):
+            raise serializers.ValidationError({'seats': 'Each seat can be booked only once'})
+
+        carriages = Carriage.objects.in_bulk({carriage_id for carriage_id, _ in seats})
+        if missing := {carriage_id for carriage_id, _ in seats} - set(carriages):
+            raise serializers.ValidationError({'seats': f'Carriages {sorted(missing)} do not exist'})
+        if len({carriage.route_id for carriage in carriages.values()}) != 1:
+            raise serializers.ValidationError({'seats': 'All seats have to be on one route'})
+        if any(carriages[carriage_id].seat_amount < seat_number for carriage_id, seat_number in seats):
+            raise serializers.ValidationError({'seats': 'Seat number is not found in this carriage'})
+
+        route_id = next(iter(carriages.values())).route_id
+        if not (leg := RouteLeg.objects.filter(route=route_id, departure_point=data['departure_point'],
+                                               arrival_point=data['arrival_point']).first()):
+            raise serializers.ValidationError({'arrival_point': 'No such leg in the route'})
+
+        mask = segment_mask(leg.departure_order, leg.arrival_order)
+        if taken := taken_seats(seats, mask):
+            raise serializers.ValidationError({'seats': [f'Seat {number} in carriage {carriage_id} is not available'
+                                                         for carriage_id, number in sorted(taken)]})
+
+        return {'tickets': [{
+            'carriage': carriages[carriage_id],
+            'seat_number': seat_number,
+            'departure_point': points[data['departure_point']],
+            'arrival_point': points[data['arrival_point']],
+            'segment_mask': mask,
+            'price': leg.price,
+        } for carriage_id, seat_number in seats]}
+
+    def create(self, validated_data):
+        return reserve_tickets(self.context['request'].user, validated_data['tickets'])
+
+
+class SearchRouteParamsSerializer(Serializer):
     departure_city = serializers.CharField(required=True, max_length=32)
     arrival_city = serializers.CharField(required=False, write_only=True, max_length=32)
     departure_day = serializers.DateTimeField(required=False, write_only=True, input_formats=('%Y-%m-%d',))
 
+
+class SearchRouteSerializer(SearchRouteParamsSerializer):
+
     def validate_departure_city(self, data):
         if not ArrivalPoint.objects.filter(id=data):
             raise serializers.ValidationError('Arrival point does not exist')
@@ -239,30 +373,54 @@ class SearchRouteSerializer(Serializer):
         return data
 
     def to_internal_value(self, data):
-        super().to_internal_value(data)
-        departure_city = data.get('departure_city')
-
-        if not departure_city:
-            raise serializers.ValidationError({'departure_city': 'This field is required.'})
-        filtered_routes = Route.objects.filter(departure_city=departure_city)
+        validated_data = super().to_internal_value(data)
+        departure_day = validated_data.get('departure_day')
+        filtered_routes = search_routes(
+            departure_point=validated_data['departure_city'],
+            arrival_point=validated_data.get('arrival_city'),
+            departure_day=departure_day.date() if departure_day else None,
+        )
+        # The view paginates the matching routes, the busiest legs have too many to answer at once
+        return filtered_routes.with_stops()
+
+
+class JourneyLegSerializer(Serializer):
+    route = serializers.IntegerField()
+    departure_point = serializers.IntegerField()
+    arrival_point = serializers.IntegerField()
+    departure_time = serializers.DateTimeField(format=DATETIME_FORMAT)
+    arrival_time = serializers.DateTimeField(format=DATETIME_FORMAT)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
 
-        filtered_arrival_points = RouteToArrivalPoint.objects.filter(arrival_point=departure_city)
 
-        for arrival_point in filtered_arrival_points:
-            if arrival_point.order != RouteToArrivalPoint.objects.filter(route=arrival_point.route).count():
-                filtered_routes |= Route.objects.filter(id=arrival_point.route.id)
+class JourneySerializer(Serializer):
+    departure_time = serializers.DateTimeField(format=DATETIME_FORMAT)
+    arrival_time = serializers.DateTimeField(format=DATETIME_FORMAT)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    transfers = serializers.IntegerField()
+    legs = JourneyLegSerializer(many=True)
 
 
-        if departure_day_str := data.get('departure_day'):
-            departure_day = datetime.strptime(departure_day_str, '%Y-%m-%d')
-            filtered_routes = filtered_routes.filter(Q(routetoarrivalpoint__arrival_time__date=departure_day) | Q(departure_time__date=departure_day))
+class SearchJourneySerializer(Serializer):
+    departure_point = serializers.PrimaryKeyRelatedField(queryset=ArrivalPoint.objects.all())
+    arrival_point = serializers.PrimaryKeyRelatedField(queryset=ArrivalPoint.objects.all())
+    departure_time = serializers.DateTimeField(required=False, input_formats=(DATETIME_FORMAT, 'iso-8601'))
+    max_transfers = serializers.IntegerField(required=False, min_value=0, max_value=MAX_JOURNEY_TRANSFERS,
+                                             default=MAX_JOURNEY_TRANSFERS)
 
+    def to_internal_value(self, data):
+        validated_data = super().to_internal_value(data)
+        if validated_data['departure_point'] == validated_data['arrival_point']:
+            raise serializers.ValidationError({'arrival_point': 'Arrival point must differ from the departure point'})
 
-        if arrival_city := data.get('arrival_city'):
-            routes_ids = RouteToArrivalPoint.objects.filter(arrival_point=arrival_city).values_list('route', flat=True)
-            filtered_routes = filtered_routes.filter(id__in=routes_ids)
-        filtered_routes = filtered_routes.exclude(departure_time__date__lt=datetime.now().date())
-        return RouteSerializer(set(filtered_routes), many=True).data
+        journeys = plan_journeys(
+            get_timetable(),
+            departure_point=validated_data['departure_point'].id,
+            arrival_point=validated_data['arrival_point'].id,
+            departure_time=validated_data.get('departure_time') or timezone.now(),
+            max_transfers=validated_data['max_transfers'],
+        )
+        return JourneySerializer(journeys, many=True).data
 
 
 class NestedOrderTicketSerializer(ModelSerializer):
@@ -273,11 +431,7 @@ class NestedOrderTicketSerializer(ModelSerializer):
 
     def to_representation(self, instance):
         data = super().to_representation(instance=instance)
-        data['arrival_point'] = ArrivalPointSerializer(instance=instance.arrival_point).data
-        data['departure_point'] = ArrivalPointSerializer(instance=instance.departure_point).data
-        data['departure_point'].update({'arrival_time': datetime.strftime(instance.carriage.route.departure_time, DATETIME_FORMAT)})
-        data['arrival_point'].update({'arrival_time': datetime.strftime(RouteToArrivalPoint.objects.filter(arrival_point_id=instance.arrival_point, route_id=instance.carriage.route).first().arrival_time, DATETIME_FORMAT)})
-
+        data.update(ticket_points_representation(instance))
         return data
 
 class OrderSerializer(ModelSerializer):
@@ -299,6 +453,25 @@ class OrderPatchSerializer(ModelSerializer):
         model = Order
         fields = ('id', 'order_status', 'discount_id')
 
+    def validate_order_status(self, data):
+        if self.instance.order_status == 'fail' and data != 'fail':
+            raise serializers.ValidationError('A failed order cannot be changed')
+        if data == 'success' and self.instance.order_status != 'success':
+            if self.instance.order_status != 'pending':
+                raise serializers.ValidationError('Only a pending order can be paid')
+            if self.instance.is_expired:
+                raise serializers.ValidationError('The seat hold of this order has expired')
+        return data
+
+    def update(self, instance, validated_data):
+        if validated_data.get('order_status') == 'fail' and instance.order_status == 'pending':
+            release_orders(Order.objects.filter(pk=instance.pk))
+            instance.refresh_from_db()
+            return instance
+        if validated_data.get('order_status') == 'success':
+            instance.expires_at = None
+        return super().update(instance, validated_data)
+
 
 
 class OrderBuySerializer(Serializer):
@@ -307,4 +480,36 @@ class OrderBuySerializer(Serializer):
     def validate_discount_id(self, data):
         if not Discount.objects.filter(id=data):
             raise serializers.ValidationError('No such discount')
-        return data
\ No newline at end of file
+        return data
+
+
+class BoardParamsSerializer(Serializer):
+    arrivals = serializers.BooleanField(default=False)
+    after = serializers.DateTimeField(required=False, input_formats=(DATETIME_FORMAT, 'iso-8601'))
+    limit = serializers.IntegerField(default=20, min_value=1, max_value=100)
+
+
+class BoardEntrySerializer(Serializer):
+    """Render the rows of ``point_board``, points are rendered like ``ArrivalPointSerializer`` does."""
+    arrival_time = serializers.DateTimeField(format=DATETIME_FORMAT)
+    departure_time = serializers.DateTimeField(format=DATETIME_FORMAT)
+
+    def to_representation(self, instance):
+        data = {
+            'route': instance['route_id'],
+            'stop_order': instance['stop_order'],
+            'arrival_time': _optional(self.fields['arrival_time'], instance['arrival_time']),
+            'departure_time': _optional(self.fields['departure_time'], instance['departure_time']),
+        }
+        for point in BOARD_POINTS:
+            data[point] = instance[f'{point}_id'] and {
+                'id': instance[f'{point}_id'],
+                'arrival_city': instance[f'{point}__arrival_city__city_name'],
+                'arrival_place': instance[f'{point}__arrival_place'],
+            }
+        data['available_seats'] = instance['available_seats']
+        return data
+
+
+def _optional(field, value):
+    return None if value is None else field.to_representation(value)
@@ -0,0 +1,40 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from tickets.boards import schedule_board_refresh
+from tickets.cache import invalidate_responses
+from tickets.inventory import sync_carriage_seats
+from tickets.models import Route, RouteToArrivalPoint, Carriage, City, ArrivalPoint, CarriageType, Ticket, Order
+from tickets.route_index import schedule_route_legs_rebuild
+
+
+@receiver((post_save, post_delete), sender=Route)
+def route_changed(sender, instance, **kwargs):
+    schedule_route_legs_rebuild(instance.id)
+
+
+@receiver((post_save, post_delete), sender=RouteToArrivalPoint)
+def route_stop_changed(sender, instance, **kwargs):
+    schedule_route_legs_rebuild(instance.route_id)
+
+
+@receiver(post_save, sender=Carriage)
+def carriage_saved(sender, instance, **kwargs):
+    sync_carriage_seats(instance)
+
+
+@receiver((post_save, post_delete), sender=Carriage)
+def carriage_changed(sender, instance, **kwargs):
+    schedule_board_refresh(route_ids=[instance.route_id])
+
+
+@receiver((post_save, post_delete), sender=City)
+@receiver((post_save, post_delete), sender=ArrivalPoint)
+@receiver((post_save, post_delete), sender=CarriageType)
+@receiver((post_save, post_delete), sender=Route)
+@receiver((post_save, post_delete), sender=RouteToArrivalPoint)
+@receiver((post_save, post_delete), sender=Carriage)
+@receiver((post_save, post_delete), sender=Ticket)
+@receiver((post_save, post_delete), sender=Order)
+def catalog_changed(sender, **kwargs):
+    invalidate_responses(sender)
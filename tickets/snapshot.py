@@ -0,0 +1,90 @@
+import bisect
+import mmap
+import os
+import struct
+from array import array
+
+_MAGIC = b'RWTT'
+_FORMAT = 1
+# magic, format, change log version, route, stop and departure counts, reserved; 48 bytes keeps the arrays aligned
+_HEADER = struct.Struct('=4sIqqqqq')
+_ITEM_SIZE = array('q').itemsize
+
+
+def write_snapshot(path, version, trips):
+    """
+    Write a timetable snapshot and atomically put it in place of the previous one.
+
+    The file is a header followed by flat ``int64`` arrays: route ids, per route offsets into the stop arrays,
+    stop points, times and cumulative prices, then every boarding sorted by (point, time) as point, time,
+    route index and stop index columns.
+
+    :param path: snapshot file path
+    :param version: timetable change log version the snapshot is up to date with
+    :param trips: iterable of (route id, stops) as built by ``tickets.timetable``, in any order
+    """
+    route_ids, offsets = array('q'), array('q', [0])
+    stop_points, stop_times, stop_prices = array('q'), array('q'), array('q')
+    boardings = []
+    for route_index, (route_id, stops) in enumerate(sorted(trips)):
+        route_ids.append(route_id)
+        for stop_index, (point, time, price) in enumerate(stops):
+            stop_points.append(point)
+            stop_times.append(time)
+            stop_prices.append(price)
+            if stop_index < len(stops) - 1:
+                boardings.append((point, time, route_index, stop_index))
+        offsets.append(len(stop_points))
+    boardings.sort()
+
+    columns = [route_ids, offsets, stop_points, stop_times, stop_prices]
+    columns += [array('q', column) for column in zip(*boardings)] if boardings else [array('q')] * 4
+
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as file:
+        file.write(_HEADER.pack(_MAGIC, _FORMAT, version, len(route_ids), len(stop_points), len(boardings), 0))
+        for column in columns:
+            column.tofile(file)
+        file.flush()
+        os.fsync(file.fileno())
+    # Readers either keep the old file mapped or open the new one, never a partially written one
+    os.replace(temporary_path, path)
+
+
+class SnapshotTimetable:
+    """
+    Read-only timetable backed by a memory-mapped snapshot file.
+
+    The pages are shared by every process mapping the same file, so workers do not hold a copy each.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        magic, file_format, self.version, routes, stops, departures, _ = _HEADER.unpack_from(view)
+        if magic != _MAGIC or file_format != _FORMAT:
+            raise ValueError(f'{path} is not a timetable snapshot of format {_FORMAT}')
+
+        offset = _HEADER.size
+        columns = []
+        for length in (routes, routes + 1, stops, stops, stops, departures, departures, departures, departures):
+            columns.append(view[offset:offset + length * _ITEM_SIZE].cast('q'))
+            offset += length * _ITEM_SIZE
+        (self._route_ids, self._offsets, self._stop_points, self._stop_times, self._stop_prices,
+         self._departure_points, self._departure_times, self._departure_routes, self._departure_stops) = columns
+
+    def trip(self, route_id):
+        index = bisect.bisect_left(self._route_ids, route_id)
+        if index == len(self._route_ids) or self._route_ids[index] != route_id:
+            raise KeyError(route_id)
+        start, end = self._offsets[index], self._offsets[index + 1]
+        return tuple(zip(self._stop_points[start:end], self._stop_times[start:end], self._stop_prices[start:end]))
+
+    def departures_from(self, point, earliest, latest):
+        low = bisect.bisect_left(self._departure_points, point)
+        high = bisect.bisect_right(self._departure_points, point, low)
+        start = bisect.bisect_left(self._departure_times, earliest, low, high)
+        end = bisect.bisect_right(self._departure_times, latest, start, high)
+        return [(self._departure_times[index], self._route_ids[self._departure_routes[index]], self._departure_stops[index])
+                for index in range(start, end)]
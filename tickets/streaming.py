@@ -0,0 +1,64 @@
+import itertools
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline delimited JSON, one object per line.
+
+    Streamed lists bypass the renderer, it is used for the rest of the responses of
+    views that accept ``application/x-ndjson`` (errors, single objects).
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict) and isinstance(data.get('data'), list):
+            data = data['data']
+        return b''.join(map(ndjson_line, data if isinstance(data, list) else [data]))
+
+
+def ndjson_line(data):
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False).encode('utf-8') + b'\n'
+
+
+def wants_stream(request):
+    """
+    :param request: DRF request of a list action
+    :return: whether the client asked for the streamed NDJSON version of the list
+    """
+    return (request.query_params.get('stream') in ('1', 'true')
+            or getattr(request.accepted_renderer, 'format', None) == NDJSONRenderer.format)
+
+
+def _serialized_rows(queryset, serializer_class, context, chunk_size):
+    rows = queryset.iterator(chunk_size=chunk_size)
+    # Serializing chunk by chunk keeps the batched lookups of the list serializers
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        for data in serializer_class(chunk, many=True, context=context).data:
+            yield ndjson_line(data)
+
+
+def stream_response(queryset, serializer_class, context, chunk_size=None):
+    """
+    Serialize the whole queryset as NDJSON without holding it in memory.
+
+    :param queryset: rows to stream, prefetches are applied per chunk
+    :param serializer_class: serializer of a single row
+    :param context: serializer context
+    :param chunk_size: rows fetched and serialized at once, STREAM_CHUNK_SIZE by default
+    :return: StreamingHttpResponse
+    """
+    chunk_size = chunk_size or settings.STREAM_CHUNK_SIZE
+    response = StreamingHttpResponse(_serialized_rows(queryset, serializer_class, context, chunk_size),
+                                     content_type=NDJSONRenderer.media_type)
+    # Let the rows through reverse proxies as they are produced
+    response['X-Accel-Buffering'] = 'no'
+    return response
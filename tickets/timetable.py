@@ -0,0 +1,261 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+
+from tickets.models import Route
+from tickets.snapshot import SnapshotTimetable, write_snapshot
+
+TIMETABLE_CACHE_ALIAS = 'timetable'
+# Routes that departed longer ago than this are not loaded, no journey can use them any more
+TIMETABLE_LOOKBACK = timedelta(days=2)
+# Workers further behind than the change log reaches rebuild the whole snapshot
+CHANGE_LOG_TIMEOUT = 24 * 60 * 60
+
+_VERSION_KEY = 'timetable:version'
+
+logger = logging.getLogger('railway.timetable')
+
+_lock = threading.Lock()
+_timetable = None
+# `time.monotonic()` when the timetable of this process was last loaded in full
+_loaded_at = 0.0
+# (file identity, mapped snapshot) of the last snapshot file seen
+_snapshot = None
+
+
+def _change_key(version):
+    return f'timetable:changes:{version}'
+
+
+def _route_stops(route):
+    """
+    :param route: route with prefetched stops
+    :return: tuple of (point id, timestamp, cumulative price in cents), the departure city first
+    """
+    stops = [(route.departure_city_id, int(route.departure_time.timestamp()), 0)]
+    for stop in sorted(route.routetoarrivalpoint_set.all(), key=lambda stop: stop.order):
+        stops.append((stop.arrival_point_id, int(stop.arrival_time.timestamp()), int(stop.price * 100)))
+    return tuple(stops)
+
+
+def _upcoming_routes():
+    routes = Route.objects.filter(departure_time__gte=timezone.now() - TIMETABLE_LOOKBACK).with_stops()
+    return routes.iterator(chunk_size=1000)
+
+
+class Timetable:
+    """
+    In-memory copy of the routes a journey can still use.
+
+    ``trips`` maps a route id to its stops, ``departures`` maps a point id to the time sorted
+    ``(timestamp, route id, stop index)`` of every train that can be boarded there.
+    """
+
+    def __init__(self, version=0):
+        self.version = version
+        self.trips = {}
+        self.departures = {}
+
+    @classmethod
+    def build(cls, version=0):
+        timetable = cls(version)
+        for route in _upcoming_routes():
+            timetable._add_trip(route.id, _route_stops(route))
+        return timetable
+
+    def trip(self, route_id):
+        return self.trips[route_id]
+
+    def _add_trip(self, route_id, stops):
+        self.trips[route_id] = stops
+        for index, (point, time, _) in enumerate(stops[:-1]):
+            bisect.insort(self.departures.setdefault(point, []), (time, route_id, index))
+
+    def _remove_trip(self, route_id):
+        for index, (point, time, _) in enumerate(self.trips.pop(route_id, ())[:-1]):
+            self.departures[point].remove((time, route_id, index))
+
+    def reload_routes(self, route_ids):
+        """Replace the given routes with their current state, deleted routes are dropped."""
+        for route_id in route_ids:
+            self._remove_trip(route_id)
+        for route in Route.objects.filter(id__in=route_ids).with_stops():
+            self._add_trip(route.id, _route_stops(route))
+
+    def departures_from(self, point, earliest, latest):
+        """:return: ``(timestamp, route id, stop index)`` of trains boardable at ``point`` between the timestamps"""
+        departures = self.departures.get(point, [])
+        start = bisect.bisect_left(departures, (earliest, ))
+        end = bisect.bisect_right(departures, (latest, float('inf')))
+        return departures[start:end]
+
+
+class LayeredTimetable:
+    """
+    Shared snapshot with the routes changed since it was built loaded on top, in this process only.
+
+    Changed routes hide their snapshot version, whether they were updated or deleted.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.changes = Timetable(snapshot.version)
+        self.changed_routes = set()
+
+    @property
+    def version(self):
+        return self.changes.version
+
+    @version.setter
+    def version(self, version):
+        self.changes.version = version
+
+    def reload_routes(self, route_ids):
+        self.changed_routes.update(route_ids)
+        self.changes.reload_routes(route_ids)
+
+    def trip(self, route_id):
+        if route_id in self.changed_routes:
+            return self.changes.trip(route_id)
+        return self.snapshot.trip(route_id)
+
+    def departures_from(self, point, earliest, latest):
+        departures = [departure for departure in self.snapshot.departures_from(point, earliest, latest)
+                      if departure[1] not in self.changed_routes]
+        return sorted(departures + self.changes.departures_from(point, earliest, latest))
+
+
+def build_snapshot(path=None):
+    """
+    Write the snapshot of upcoming routes that the workers of this host map instead of each loading the timetable.
+
+    :param path: snapshot file, ``TIMETABLE_SNAPSHOT_PATH`` by default
+    :return: change log version the snapshot is up to date with
+    """
+    # Taken before reading the routes, changes committed meanwhile are applied again on top of the snapshot
+    version = _current_version(caches[TIMETABLE_CACHE_ALIAS])
+    write_snapshot(path or settings.TIMETABLE_SNAPSHOT_PATH, version,
+                   ((route.id, _route_stops(route)) for route in _upcoming_routes()))
+    return version
+
+
+def _load_snapshot():
+    """Map the snapshot file, again whenever a new one has replaced it. ``None`` when there is none."""
+    global _snapshot
+
+    try:
+        stat = os.stat(settings.TIMETABLE_SNAPSHOT_PATH)
+    except FileNotFoundError:
+        return None
+    identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if _snapshot is None or _snapshot[0] != identity:
+        _snapshot = (identity, SnapshotTimetable(settings.TIMETABLE_SNAPSHOT_PATH))
+    return _snapshot[1]
+
+
+def _current_version(cache):
+    cache.add(_VERSION_KEY, 0, timeout=None)
+    return cache.get(_VERSION_KEY, 0)
+
+
+def _process_local(cache):
+    return isinstance(cache, (LocMemCache, DummyCache))
+
+
+def check_change_log():
+    """
+    Log an error when the change log cache is not shared although several web workers run.
+
+    Changes published by one process never reach the others then, which only see them once they load the timetable
+    again, every ``TIMETABLE_RELOAD_INTERVAL`` seconds.
+    """
+    workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+    if workers > 1 and _process_local(caches[TIMETABLE_CACHE_ALIAS]):
+        logger.error(
+            'The %r cache is local to each process but %d workers run, they only see route changes of the others '
+            'when they load the timetable again every %s seconds. Set TIMETABLE_CACHE_BACKEND to a shared cache '
+            'such as Redis or Memcached.', TIMETABLE_CACHE_ALIAS, workers, settings.TIMETABLE_RELOAD_INTERVAL,
+        )
+
+
+def record_route_changes(route_ids):
+    """Publish changed routes to the timetables of every worker, to be called after the change commits."""
+    cache = caches[TIMETABLE_CACHE_ALIAS]
+    try:
+        version = cache.incr(_VERSION_KEY)
+    except ValueError:
+        cache.add(_VERSION_KEY, 0, timeout=None)
+        version = cache.incr(_VERSION_KEY)
+    cache.set(_change_key(version), list(route_ids), timeout=CHANGE_LOG_TIMEOUT)
+
+
+def _reload_local(cache, snapshot, version):
+    """
+    Load the timetable again from a change log that only holds the changes of this process.
+
+    Versions of such a log are counted by each process, so they say nothing about the snapshot. The changes still in
+    the log are made again on top of the snapshot, older ones are in the snapshot when it is refreshed more often than
+    ``CHANGE_LOG_TIMEOUT``. Without a snapshot the timetable is loaded from scratch.
+    """
+    if snapshot is None:
+        return Timetable.build(version)
+
+    timetable = LayeredTimetable(snapshot)
+    changes = cache.get_many([_change_key(logged) for logged in range(1, version + 1)])
+    timetable.reload_routes(set().union(*changes.values()))
+    timetable.version = version
+    return timetable
+
+
+def get_timetable():
+    """
+    Return the timetable of this process, brought up to date with the published route changes.
+
+    A new snapshot file is picked up as soon as it replaces the previous one. On top of it, or of the timetable
+    this process loaded itself when there is no snapshot, only the changed routes are reloaded. The timetable is
+    loaded from scratch when the change log no longer covers the missed versions.
+
+    A change log local to this process misses the changes of other processes, the timetable is then loaded again
+    every ``TIMETABLE_RELOAD_INTERVAL`` seconds as well, see ``_reload_local``.
+    """
+    global _timetable, _loaded_at
+
+    with _lock:
+        cache = caches[TIMETABLE_CACHE_ALIAS]
+        version = _current_version(cache)
+        previous_snapshot = _snapshot
+        snapshot = _load_snapshot()
+        new_snapshot = snapshot is not None and _snapshot is not previous_snapshot
+
+        if _process_local(cache) and (new_snapshot or time.monotonic() - _loaded_at > settings.TIMETABLE_RELOAD_INTERVAL):
+            _timetable = _reload_local(cache, snapshot, version)
+            _loaded_at = time.monotonic()
+            return _timetable
+
+        if new_snapshot:
+            _timetable = LayeredTimetable(snapshot)
+            _loaded_at = time.monotonic()
+
+        if _timetable is not None and _timetable.version == version:
+            return _timetable
+
+        if _timetable is not None and _timetable.version < version:
+            change_keys = [_change_key(missed) for missed in range(_timetable.version + 1, version + 1)]
+            changes = cache.get_many(change_keys)
+            if len(changes) == len(change_keys):
+                _timetable.reload_routes(set().union(*changes.values()))
+                _timetable.version = version
+                return _timetable
+
+        _timetable = Timetable.build(version)
+        _loaded_at = time.monotonic()
+        return _timetable
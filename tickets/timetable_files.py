@@ -0,0 +1,228 @@
+"""
+Timetable files: CSV with one row per stop of a trip, like GTFS ``stop_times.txt``.
+
+    trip,stop,city,place,time,price,carriages
+    IC-701-0101,0,Kyiv,Central station,2031-01-01 08:00,0,coupe:36;platzkart:54
+    IC-701-0101,1,Lviv,Main station,2031-01-01 13:30,25.00,
+
+Rows of a trip are consecutive and ordered by ``stop``, stop 0 is the departure. ``price`` is the fare from the
+departure like ``RouteToArrivalPoint.price``. Times without an offset are local to the city of the stop. The carriages
+of the train, ``type:seats`` separated by ``;``, are listed on the departure row.
+"""
+import csv
+import io
+import itertools
+from collections import namedtuple
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from rest_framework import serializers
+
+from tickets.cache import invalidate_responses
+from tickets.inventory import MAX_ROUTE_SEGMENTS, create_carriage_seats
+from tickets.models import City, ArrivalPoint, Route, RouteToArrivalPoint, CarriageType, Carriage
+from tickets.route_index import rebuild_route_legs
+
+COLUMNS = ('trip', 'stop', 'city', 'place', 'time', 'price', 'carriages')
+REQUIRED_COLUMNS = ('trip', 'stop', 'city', 'place', 'time')
+MAX_SEAT_AMOUNT = 100
+
+_Trip = namedtuple('_Trip', ('external_id', 'stops', 'carriages'))
+_Stop = namedtuple('_Stop', ('point', 'time', 'price'))
+# Same limits as ``RouteToArrivalPoint.price`` in ``RouteSerializer``
+_PRICE_FIELD = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+def _error(line, message):
+    return serializers.ValidationError({'file': f'Line {line}: {message}'})
+
+
+class _Lookups:
+    """Cities, arrival points and carriage types by name, loaded once per import and extended with created ones."""
+
+    def __init__(self):
+        self.cities = {city.city_name: city for city in City.objects.all()}
+        self.points = {(city, place): point_id for city, place, point_id in
+                       ArrivalPoint.objects.values_list('arrival_city__city_name', 'arrival_place', 'id')}
+        self.carriage_types = {}
+        for carriage_type_id, name in CarriageType.objects.order_by('id').values_list('id', 'carriage_type_name'):
+            self.carriage_types.setdefault(name, carriage_type_id)
+
+    def timezone(self, city):
+        return ZoneInfo(self.cities[city].timezone if city in self.cities else settings.TIME_ZONE)
+
+    def add_points(self, names):
+        """Create the cities and arrival points of ``names``, (city, place) pairs, that do not exist yet."""
+        if new_cities := {city for city, _ in names} - self.cities.keys():
+            self.cities.update((city.city_name, city) for city in City.objects.bulk_create(City(city_name=name) for name in new_cities))
+        if new_points := names - self.points.keys():
+            created = ArrivalPoint.objects.bulk_create(
+                ArrivalPoint(arrival_city=self.cities[city], arrival_place=place) for city, place in new_points
+            )
+            self.points.update(((point.arrival_city.city_name, point.arrival_place), point.id) for point in created)
+
+    def carriage_type(self, name):
+        if name not in self.carriage_types:
+            self.carriage_types[name] = CarriageType.objects.create(carriage_type_name=name).id
+        return self.carriage_types[name]
+
+
+def _read_trips(file):
+    """Yield the rows of each trip with their line numbers."""
+    reader = csv.DictReader(file)
+    if missing := [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]:
+        raise _error(1, f'Missing columns {", ".join(missing)}')
+
+    seen = set()
+    for trip_id, rows in itertools.groupby(enumerate(reader, start=2), key=lambda line_row: (line_row[1]['trip'] or '').strip()):
+        rows = list(rows)
+        if trip_id in seen:
+            raise _error(rows[0][0], f'The rows of trip "{trip_id}" are not consecutive')
+        seen.add(trip_id)
+        yield trip_id, rows
+
+
+def _parse_time(value, city, lookups, line):
+    try:
+        moment = datetime.fromisoformat((value or '').strip())
+    except ValueError:
+        raise _error(line, f'Invalid time "{value}"')
+    return timezone.make_aware(moment, lookups.timezone(city)) if timezone.is_naive(moment) else moment
+
+
+def _parse_carriages(value, line):
+    carriages = []
+    choices = {name for name, _ in CarriageType.CARRIAGE_CHOICES}
+    for carriage in filter(None, (value or '').split(';')):
+        name, _, seats = carriage.strip().partition(':')
+        if name not in choices:
+            raise _error(line, f'Unknown carriage type "{name}"')
+        if not seats.isdigit() or not 0 < int(seats) <= MAX_SEAT_AMOUNT:
+            raise _error(line, f'Seat amount of a carriage has to be between 1 and {MAX_SEAT_AMOUNT}')
+        carriages.append((name, int(seats)))
+    return carriages
+
+
+def _parse_trip(trip_id, rows, lookups):
+    """Check a trip the way ``RouteSerializer`` checks a route."""
+    if not trip_id or len(trip_id) > 64:
+        raise _error(rows[0][0], 'Trip ids have 1 to 64 characters')
+    if not 2 <= len(rows) <= MAX_ROUTE_SEGMENTS + 1:
+        raise _error(rows[0][0], f'A trip has a departure and 1 to {MAX_ROUTE_SEGMENTS} stops')
+
+    stops = []
+    for order, (line, row) in enumerate(rows):
+        if (row['stop'] or '').strip() != str(order):
+            raise _error(line, f'Expected stop {order} of trip "{trip_id}"')
+        city, place = (row['city'] or '').strip(), (row['place'] or '').strip()
+        if not (0 < len(city) <= City._meta.get_field('city_name').max_length
+                and 0 < len(place) <= ArrivalPoint._meta.get_field('arrival_place').max_length):
+            raise _error(line, 'Invalid city or place')
+        try:
+            price = _PRICE_FIELD.run_validation((row.get('price') or '0').strip())
+        except serializers.ValidationError as error:
+            raise _error(line, f'Invalid price "{row.get("price")}": {error.detail[0]}')
+        stops.append(_Stop((city, place), _parse_time(row['time'], city, lookups, line), price))
+
+        if order == 1 and stops[1].time <= stops[0].time:
+            raise _error(line, 'First arrival time is before the departure time')
+        if order > 1 and (stops[-1].time < stops[-2].time or stops[-1].price < stops[-2].price):
+            raise _error(line, 'The order of arrival points is invalid, check time and price')
+
+    return _Trip(trip_id, stops, _parse_carriages(rows[0][1].get('carriages'), rows[0][0]))
+
+
+@transaction.atomic
+def _import_batch(trips, lookups):
+    existing = set(Route.objects.filter(external_id__in=[trip.external_id for trip in trips]).values_list('external_id', flat=True))
+    if not (trips := [trip for trip in trips if trip.external_id not in existing]):
+        return 0
+
+    lookups.add_points({stop.point for trip in trips for stop in trip.stops})
+    routes = Route.objects.bulk_create(
+        Route(external_id=trip.external_id, departure_city_id=lookups.points[trip.stops[0].point], departure_time=trip.stops[0].time)
+        for trip in trips
+    )
+    RouteToArrivalPoint.objects.bulk_create(
+        (RouteToArrivalPoint(route=route, arrival_point_id=lookups.points[stop.point], order=order, price=stop.price,
+                             arrival_time=stop.time)
+         for route, trip in zip(routes, trips) for order, stop in enumerate(trip.stops[1:], start=1)),
+        batch_size=5000,
+    )
+    carriages = Carriage.objects.bulk_create(
+        (Carriage(route=route, carriage_type_id=lookups.carriage_type(name), seat_amount=seats)
+         for route, trip in zip(routes, trips) for name, seats in trip.carriages),
+        batch_size=5000,
+    )
+    # Bulk inserts skip the signals that maintain the seat inventory, route legs and cached responses
+    create_carriage_seats(carriages)
+    rebuild_route_legs([route.id for route in routes])
+    invalidate_responses(City, ArrivalPoint, CarriageType, Route, RouteToArrivalPoint, Carriage)
+    return len(trips)
+
+
+def import_timetable(file, batch_size=500, progress=None):
+    """
+    Create the routes, stops and carriages of a timetable file, ``batch_size`` trips per transaction.
+
+    The file is read as it is imported. Trips imported before, by ``Route.external_id``, are skipped, so an
+    interrupted import is resumed by importing the same file again. Missing cities and arrival points are created.
+
+    :param file: iterable of the CSV lines, e.g. a file opened with ``newline=''``
+    :param progress: called with the numbers of created and skipped trips after each batch
+    :return: numbers of created and skipped trips
+    :raise serializers.ValidationError: a malformed trip, the batches before it stay imported
+    """
+    lookups = _Lookups()
+    created = skipped = 0
+    trips = _read_trips(file)
+    try:
+        while batch := list(itertools.islice(trips, batch_size)):
+            batch_created = _import_batch([_parse_trip(trip_id, rows, lookups) for trip_id, rows in batch], lookups)
+            created, skipped = created + batch_created, skipped + len(batch) - batch_created
+            if progress:
+                progress(created, skipped)
+    except serializers.ValidationError as error:
+        if created:
+            error.detail['file'] = f'{error.detail["file"]}, {created} routes before it were imported'
+        raise
+    return created, skipped
+
+
+def _trip_rows(route):
+    trip_id = route.external_id or f'route-{route.id}'
+    carriages = ';'.join(f'{carriage.carriage_type.carriage_type_name}:{carriage.seat_amount}' for carriage in route.carriages.all())
+    stops = [(route.departure_city, route.departure_time, 0)]
+    stops += [(stop.arrival_point, stop.arrival_time, stop.price) for stop in route.routetoarrivalpoint_set.all()]
+    for order, (point, moment, price) in enumerate(stops):
+        local_time = moment.astimezone(ZoneInfo(point.arrival_city.timezone)).isoformat(sep=' ', timespec='minutes')
+        yield trip_id, order, point.arrival_city.city_name, point.arrival_place, local_time, price, carriages if order == 0 else ''
+
+
+def export_timetable(routes=None, chunk_size=500):
+    """
+    Write routes in the timetable file format, ``import_timetable`` reads it back.
+
+    :param routes: queryset of the routes to export, all by default
+    :param chunk_size: routes loaded at once
+    :return: iterator of CSV text, one piece per chunk of routes
+    """
+    routes = (Route.objects.all() if routes is None else routes).with_stops().prefetch_related(
+        Prefetch('carriages', queryset=Carriage.objects.select_related('carriage_type').order_by('id'))
+    ).order_by('departure_time', 'id').iterator(chunk_size=chunk_size)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    while chunk := list(itertools.islice(routes, chunk_size)):
+        for route in chunk:
+            writer.writerows(_trip_rows(route))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
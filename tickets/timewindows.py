@@ -0,0 +1,32 @@
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+
+def validate_timezone(name):
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValidationError(f'Unknown time zone {name}')
+
+
+def day_window(day, tz_name):
+    """
+    Turn a calendar day at a station into a timestamp range.
+
+    Filtering with ``field__gte=start, field__lt=end`` is an index range scan, unlike ``field__date=day``
+    which casts every row (and in the server time zone rather than the station's).
+
+    :param day: date in the station's local calendar
+    :param tz_name: IANA time zone of the station
+    :return: half-open (start, end) aware datetimes of the day
+    """
+    tz = ZoneInfo(tz_name)
+    return datetime.combine(day, time.min, tzinfo=tz), datetime.combine(day + timedelta(days=1), time.min, tzinfo=tz)
+
+
+def local_today(tz_name):
+    """:return: current date at a station in the ``tz_name`` time zone"""
+    return timezone.now().astimezone(ZoneInfo(tz_name)).date()
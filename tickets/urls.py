@@ -1,6 +1,7 @@
+from django.urls import path
 from rest_framework.routers import SimpleRouter
 
-from tickets import views
+from tickets import async_views, views
 
 
 router = SimpleRouter()
@@ -13,4 +14,11 @@ router.register(r'carriage_types', viewset=views.CarriageTypeViewSet)
 router.register(r'carriages', viewset=views.CarriageViewSet)
 
 
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path('metrics/queries/', views.QueryMetricsView.as_view(), name='query-metrics'),
+    path('async/routes/search/', async_views.search_routes, name='async-route-search'),
+    path('async/routes/<int:pk>/carriages/', async_views.route_carriages, name='async-route-carriages'),
+    path('async/cities/', async_views.cities, name='async-city-list'),
+    path('async/arrival_points/', async_views.arrival_points, name='async-arrivalpoint-list'),
+    path('async/carriage_types/', async_views.carriage_types, name='async-carriagetype-list'),
+]
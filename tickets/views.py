@@ -1,18 +1,33 @@
-import datetime
+import codecs
 import decimal
 
-import pytz
-import stripe
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import status, viewsets, serializers
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
-
-from tickets.models import Ticket, ArrivalPoint, Route, Order, City, CarriageType, Carriage
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+from tickets.boards import point_board
+from tickets.cache import cached_response
+from tickets.discounts import redeem_discount
+from tickets.inventory import leg_mask
+from tickets.models import Ticket, ArrivalPoint, Route, Order, City, CarriageType, Carriage, RouteToArrivalPoint
+from tickets.payments import PaymentError, PaymentPending, order_client_secret
+from tickets.querystats import query_metrics
 from tickets.serializers import TicketSerializer, RouteSerializer, ArrivalPointSerializer, OrderSerializer, \
     CitySerializer, CarriageTypeSerializer, CarriageSerializer, SearchRouteSerializer, CarriageSeatsSerializer, \
-    OrderPatchSerializer, OrderBuySerializer
-from users.models import Discount
+    OrderPatchSerializer, OrderBuySerializer, TicketBatchSerializer, SearchJourneySerializer, BoardParamsSerializer, \
+    BoardEntrySerializer, CarriageLegParamsSerializer
+from tickets.streaming import NDJSONRenderer, stream_response, wants_stream
+from tickets.timetable_files import export_timetable, import_timetable
+from users.discount_types import get_discount_type
+from users.models import Discount, DiscountType
 
 
 class RailwayAPI:
@@ -24,7 +39,14 @@ class RailwayAPI:
         'retrieve': (AllowAny,),
         'destroy': (IsAdminUser,),
     }
+    # Most SQL queries an action may run whatever the page size, authentication included, see `tickets.querystats`
+    query_action_budgets = {
+        'list': 5,
+        'retrieve': 5,
+    }
     serializer_action_classes = {}
+    # Columns the cursor paginator orders and seeks by, should be backed by an index
+    pagination_ordering = ('id', )
 
     def get_serializer_class(self):
         return self.serializer_action_classes.get(self.action, super().serializer_class)
@@ -48,6 +70,7 @@ class CityViewSet(viewsets.ModelViewSet, RailwayAPI):
     permission_classes = (IsAuthenticated,)
     serializer_class = CitySerializer
 
+    @cached_response(City)
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
 
@@ -61,10 +84,24 @@ class CityViewSet(viewsets.ModelViewSet, RailwayAPI):
 
 
 class ArrivalPointViewSet(viewsets.ModelViewSet, RailwayAPI):
-    queryset = ArrivalPoint.objects.all()
+    queryset = ArrivalPoint.objects.select_related('arrival_city')
     permission_classes = (IsAuthenticated,)
     serializer_class = ArrivalPointSerializer
+    query_action_budgets = {
+        **RailwayAPI.query_action_budgets,
+        'board': 2,
+    }
 
+    @action(methods=('GET', ), detail=True, url_path='board', permission_classes=(AllowAny,))
+    def board(self, request, pk):
+        point = self.get_object()
+        params = BoardParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        entries = point_board(point.id, params.validated_data['arrivals'], params.validated_data.get('after'))
+        serializer = BoardEntrySerializer(entries[:params.validated_data['limit']], many=True)
+        return Response({'data': serializer.data}, status=status.HTTP_200_OK)
+
+    @cached_response(ArrivalPoint, City)
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
 
@@ -82,6 +119,7 @@ class CarriageTypeViewSet(viewsets.ModelViewSet, RailwayAPI):
     permission_classes = (IsAuthenticated,)
     serializer_class = CarriageTypeSerializer
 
+    @cached_response(CarriageType)
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
 
@@ -94,7 +132,7 @@ class CarriageTypeViewSet(viewsets.ModelViewSet, RailwayAPI):
         return Response({'data': serializer.data}, status=status.HTTP_200_OK)
 
 class CarriageViewSet(viewsets.ModelViewSet, RailwayAPI):
-    queryset = Carriage.objects.all()
+    queryset = Carriage.objects.prefetch_related(Prefetch('route', queryset=Route.objects.with_stops()))
     permission_classes = (IsAuthenticated,)
     serializer_class = CarriageSerializer
 
@@ -112,36 +150,82 @@ class CarriageViewSet(viewsets.ModelViewSet, RailwayAPI):
 
 
 class RouteViewSet(viewsets.ModelViewSet, RailwayAPI):
-    queryset = Route.objects.all()
+    queryset = Route.objects.with_stops()
     permission_classes = (IsAuthenticated,)
     serializer_class = RouteSerializer
     serializer_action_classes = {
-        'search_route': SearchRouteSerializer
+        'search_route': SearchRouteSerializer,
+        'search_journeys': SearchJourneySerializer,
+    }
+    query_action_budgets = {
+        **RailwayAPI.query_action_budgets,
+        'search_route': 8,
+        'search_journeys': 6,
+        'get_carriages': 8,
     }
+    pagination_ordering = ('departure_time', 'id')
 
     def get_serializer_class(self):
         return self.serializer_action_classes.get(self.action, self.serializer_class)
 
     @action(methods=('POST', ), detail=False, url_path='search')
     def search_route(self, request):
+        # Pages are fetched by posting the same search to the `next` link
         serializer = SearchRouteSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        page = self.paginate_queryset(serializer.validated_data)
+        return self.get_paginated_response(RouteSerializer(page, many=True).data)
+
+    @action(methods=('POST', ), detail=False, url_path='journeys')
+    def search_journeys(self, request):
+        serializer = SearchJourneySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         return Response({'data': serializer.validated_data}, status=status.HTTP_200_OK)
 
+    @action(methods=('POST', ), detail=False, url_path='import', permission_classes=(IsAdminUser,),
+            parser_classes=(MultiPartParser,))
+    def import_routes(self, request):
+        if (file := request.FILES.get('file')) is None:
+            return Response({'file': 'Upload the timetable CSV as "file"'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            created, skipped = import_timetable(codecs.iterdecode(file, 'utf-8-sig'))
+        except UnicodeDecodeError:
+            return Response({'file': 'The timetable CSV has to be UTF-8 encoded'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'data': {'created': created, 'skipped': skipped}}, status=status.HTTP_200_OK)
+
+    @action(methods=('GET', ), detail=False, url_path='export', permission_classes=(IsAdminUser,))
+    def export_routes(self, request):
+        routes = Route.objects.all()
+        if request.query_params.get('upcoming') in ('1', 'true'):
+            routes = routes.filter(departure_time__gte=timezone.now())
+        response = StreamingHttpResponse(export_timetable(routes), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="timetable.csv"'
+        return response
+
     @action(methods=('GET', ), detail=True, url_path='carriages')
     def get_carriages(self, request, pk):
-        carriages = Carriage.objects.filter(route_id=pk)
-        serializer = CarriageSeatsSerializer(carriages, many=True)
+        context = {}
+        params = CarriageLegParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        if params.validated_data:
+            if (mask := leg_mask(pk, params.validated_data['departure_point'], params.validated_data['arrival_point'])) is None:
+                return Response('No such leg in the route', status=status.HTTP_400_BAD_REQUEST)
+            context['segment_mask'] = mask
+
+        carriages = Carriage.objects.filter(route_id=pk).prefetch_related(Prefetch('route', queryset=Route.objects.with_stops()))
+        serializer = CarriageSeatsSerializer(carriages, many=True, context=context)
         return Response(data={'data': serializer.data}, status=status.HTTP_200_OK)
 
+    @cached_response(Route, RouteToArrivalPoint, ArrivalPoint, City, Carriage, Ticket, Order)
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.filter(departure_time__gte=timezone.now())
 
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
-        queryset = queryset.exclude(departure_time__lt=datetime.datetime.now().replace(tzinfo=pytz.UTC))
+
         serializer = self.get_serializer(queryset, many=True)
         return Response({'data': serializer.data}, status=status.HTTP_200_OK)
 
@@ -150,9 +234,37 @@ class TicketsViewSet(viewsets.ModelViewSet):
     queryset = Ticket.objects.all()
     permission_classes = (IsAuthenticated,)
     serializer_class = TicketSerializer
+    # Tickets are only booked and deleted, both go through the seat inventory, moving one is a delete and a booking
+    http_method_names = ('get', 'post', 'delete', 'head', 'options')
+    renderer_classes = (*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer)
+    query_action_budgets = {
+        'list': 4,
+        'retrieve': 4,
+    }
+
+    def is_lightweight(self):
+        return self.request.query_params.get('lightweight') in ('1', 'true')
+
+    def get_queryset(self):
+        return super().get_queryset().with_details(lightweight=self.is_lightweight())
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['lightweight'] = self.is_lightweight()
+        return context
+
+    @action(methods=('POST', ), detail=False, url_path='batch')
+    def batch_create(self, request):
+        serializer = TicketBatchSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        tickets = self.get_queryset().filter(id__in=[ticket.id for ticket in serializer.save()])
+        return Response({'data': TicketSerializer(tickets, many=True, context=self.get_serializer_context()).data},
+                        status=status.HTTP_201_CREATED)
 
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
+        if wants_stream(request):
+            return stream_response(queryset, self.get_serializer_class(), self.get_serializer_context())
 
         page = self.paginate_queryset(queryset)
         if page is not None:
@@ -164,26 +276,34 @@ class TicketsViewSet(viewsets.ModelViewSet):
 
 
 class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
+    queryset = Order.objects.with_tickets()
     permission_classes = (IsAuthenticated,)
     serializer_class = OrderSerializer
+    renderer_classes = (*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer)
     serializer_action_classes = {
         'partial_update' : OrderPatchSerializer,
         'buy_order': OrderBuySerializer
     }
+    query_action_budgets = {
+        'list': 4,
+        'retrieve': 4,
+        'status_orders': 4,
+    }
 
     def get_serializer_class(self):
         return self.serializer_action_classes.get(self.action, self.serializer_class)
 
     def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
+        queryset = self.filter_queryset(self.get_queryset()).filter(user=request.user)
+        if wants_stream(request):
+            return stream_response(queryset, self.get_serializer_class(), self.get_serializer_context())
 
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = self.get_serializer(queryset.filter(user=request.user), many=True)
+        serializer = self.get_serializer(queryset, many=True)
         return Response({'data': serializer.data}, status=status.HTTP_200_OK)
 
     def partial_update(self, request, *args, **kwargs):
@@ -191,25 +311,16 @@ class OrderViewSet(viewsets.ModelViewSet):
         if not request.data.get('order_status'):
             raise serializers.ValidationError({'order_status': "This field is required"})
 
-        if request.data.get('order_status') == 'success' and request.data.get('discount_id'):
-            discount = Discount.objects.get(id=request.data.get('discount_id'))
-            discount.usage_amount += 1
-            discount.save()
-
-            order = self.get_object()
-            price = order.total_price - order.total_price * decimal.Decimal(discount.discount_type.discount_percent) / 100
-            order.total_price = price
-            order.save()
-
-            if discount.discount_type.discount_type_name == 'limited' and discount.usage_amount >= discount.discount_type.discount_limit:
-                discount.delete()
-        return self.update(request, *args, **kwargs)
+        with transaction.atomic():
+            if request.data.get('order_status') == 'success' and request.data.get('discount_id'):
+                redeem_discount(self.get_object(), request.data.get('discount_id'), request.user)
+            return self.update(request, *args, **kwargs)
 
     @action(methods=('GET',), detail=False, url_path=r'status/(?P<order_status>\w+)')
     def status_orders(self, request, order_status):
         if order_status not in [status_order[0] for status_order in Order.STATUS_CHOICES]:
             return Response('No such status', status=status.HTTP_400_BAD_REQUEST)
-        filtered_orders = Order.objects.filter(order_status=order_status, user=request.user)
+        filtered_orders = self.get_queryset().filter(order_status=order_status, user=request.user)
         return Response({'data': self.serializer_class(filtered_orders, many=True).data}, status=status.HTTP_200_OK)
 
     @action(methods=('POST', ), detail=True, url_path='buy')
@@ -218,6 +329,8 @@ class OrderViewSet(viewsets.ModelViewSet):
         price = order.total_price
         if not order or not price or order.order_status == 'success':
             return Response('No pending or fail orders', status=status.HTTP_400_BAD_REQUEST)
+        if order.is_expired:
+            return Response('The seat hold of this order has expired', status=status.HTTP_400_BAD_REQUEST)
 
         serializer = self.get_serializer_class()(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -227,15 +340,29 @@ class OrderViewSet(viewsets.ModelViewSet):
             if discount.user != request.user:
                 return Response('User does not have this discount', status=status.HTTP_400_BAD_REQUEST)
 
-            if discount.discount_type.discount_type_name == 'permanent' or discount.usage_amount < discount.discount_type.discount_limit:
-                price = price - price * decimal.Decimal(discount.discount_type.discount_percent) / 100
+            try:
+                discount_type = get_discount_type(discount.discount_type_id)
+            except DiscountType.DoesNotExist:
+                return Response('The discount type of this discount does not exist', status=status.HTTP_400_BAD_REQUEST)
+            if discount_type.discount_type_name == 'permanent' or discount.usage_amount < discount_type.discount_limit:
+                price = price - price * decimal.Decimal(discount_type.discount_percent) / 100
             else:
                 return Response('The number of uses of the discount exceeded the allowable amount', status=status.HTTP_400_BAD_REQUEST)
 
 
-        payment_intent = stripe.PaymentIntent.create(
-            amount=int(price * 100),
-            currency="usd",
-            payment_method_types=["card"],
-        )
-        return Response({'client_secret': payment_intent.get('client_secret')}, status=status.HTTP_200_OK)
+        try:
+            client_secret = order_client_secret(order, price)
+        except PaymentPending:
+            return Response('The payment is being prepared, try again shortly', status=status.HTTP_202_ACCEPTED,
+                            headers={'Retry-After': '1'})
+        except PaymentError:
+            return Response('The payment provider is unavailable', status=status.HTTP_502_BAD_GATEWAY)
+        return Response({'client_secret': client_secret}, status=status.HTTP_200_OK)
+
+
+class QueryMetricsView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        """SQL statistics sampled by the worker that answers, see `tickets.querystats.QueryStatsMiddleware`."""
+        return Response({'data': query_metrics()}, status=status.HTTP_200_OK)
@@ -0,0 +1,55 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from users.models import DiscountType
+
+_discount_types = {}
+_loaded_at = None
+_lock = threading.Lock()
+
+
+def get_discount_type(discount_type_id):
+    """
+    Return a discount type from the process-local cache, loading all of them on first use.
+
+    Discount types are reference data that rarely change. Changes made in this process clear the cache through
+    signals, changes made by other workers show up after ``DISCOUNT_TYPE_CACHE_TIMEOUT`` seconds at the latest.
+    Discount types missing from the cache are looked up again before giving up.
+    The returned instances are shared between threads and must not be modified.
+
+    :param discount_type_id: id of the discount type
+    :raise DiscountType.DoesNotExist: no such discount type
+    """
+    if (discount_type := _load().get(discount_type_id)) is None:
+        # Created by another worker since this process loaded the cache
+        discount_type = _load(reload=True).get(discount_type_id)
+    if discount_type is None:
+        raise DiscountType.DoesNotExist(f'No discount type with id {discount_type_id}')
+    return discount_type
+
+
+def _load(reload=False):
+    global _discount_types, _loaded_at
+
+    if reload or _loaded_at is None or time.monotonic() - _loaded_at > settings.DISCOUNT_TYPE_CACHE_TIMEOUT:
+        with _lock:
+            if reload or _loaded_at is None or time.monotonic() - _loaded_at > settings.DISCOUNT_TYPE_CACHE_TIMEOUT:
+                _discount_types = DiscountType.objects.in_bulk()
+                _loaded_at = time.monotonic()
+    return _discount_types
+
+
+def _clear():
+    global _loaded_at
+    with _lock:
+        _loaded_at = None
+
+
+def clear_discount_types():
+    """Reload discount types on next use, now and once the current transaction commits."""
+    # Cleared twice so a reload during the transaction cannot keep its uncommitted or rolled back state
+    _clear()
+    transaction.on_commit(_clear)
@@ -1,6 +1,7 @@
 from django.contrib.auth.hashers import make_password
 from rest_framework import serializers
 
+from users.discount_types import get_discount_type
 from users.models import User, Discount, DiscountType
 
 
@@ -51,5 +52,9 @@ class DiscountSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        data['discount_type'] = DiscountTypeSerializer(instance=DiscountType.objects.get(id=data['discount_type'])).data
+        if Discount.discount_type.is_cached(instance):
+            discount_type = instance.discount_type
+        else:
+            discount_type = get_discount_type(instance.discount_type_id)
+        data['discount_type'] = DiscountTypeSerializer(instance=discount_type).data
         return data
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from users.discount_types import clear_discount_types
+from users.models import DiscountType
+
+
+@receiver((post_save, post_delete), sender=DiscountType)
+def discount_type_changed(sender, **kwargs):
+    clear_discount_types()
@@ -43,19 +43,23 @@ class UserViewSet(viewsets.GenericViewSet,
 
 
 class DiscountViewSet(viewsets.ModelViewSet):
-    queryset = Discount.objects.all()
+    queryset = Discount.objects.select_related('discount_type')
     permission_classes = (IsAuthenticated, )
     serializer_class = DiscountSerializer
+    query_action_budgets = {
+        'list': 3,
+        'retrieve': 3,
+    }
 
     def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
+        queryset = self.filter_queryset(self.get_queryset()).filter(user=request.user)
 
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = self.get_serializer(queryset.filter(user=request.user), many=True)
+        serializer = self.get_serializer(queryset, many=True)
         return Response({'data': serializer.data}, status=status.HTTP_200_OK)
 
 